@@ -0,0 +1,3 @@
+"""Benchmarks for the Flask API. Run each one as a module from the repo
+root, e.g. `python -m benchmarks.bench_get_one_user`.
+"""
@@ -0,0 +1,87 @@
+"""Bytes on the wire against latency for each response compression, as
+the tables grow.
+
+For every table size the user listing (built in memory and streamed) and
+GET /blog_post/numeric_body (streamed) are fetched through the test
+client with each available encoding at each `--levels` level, and with
+none. The last column adds the time to send the body over a link of
+`--mbps` megabits per second, to show where compressing pays off.
+
+    python -m benchmarks.bench_compression [--sizes 1000 10000 100000] \\
+        [--levels 1 6 9] [--mbps 100]
+"""
+import argparse
+import os
+import statistics
+
+import compression
+from benchmarks.common import seed_blog_posts, seed_users, temp_database_url, time_calls
+
+ENDPOINTS = (
+    "/user/ascending_id",
+    "/user/ascending_id?stream=json",
+    "/blog_post/numeric_body",
+)
+
+
+def measure(client, url, encoding, repeat):
+    """Median latency in ms and body size in bytes of `url`."""
+    headers = {"Accept-Encoding": encoding}
+    size = len(client.get(url, headers=headers).data)
+    latencies = time_calls(lambda: client.get(url, headers=headers).data, repeat)
+    return statistics.median(latencies), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--mbps", type=float, default=100, help="link speed for the last column")
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    import server
+
+    # one app per level, all on the same database and without the cache
+    apps = {
+        level: server.create_app({
+            "CACHE_BACKEND": "none", "COMPRESSION_LEVEL": level, "COMPRESSION_MIN_SIZE": 0,
+        })
+        for level in args.levels
+    }
+    with apps[args.levels[0]].app_context():
+        server.init_db()
+    clients = {level: app.test_client() for level, app in apps.items()}
+    runs = [("identity", args.levels[0])] + [
+        (encoding, level)
+        for encoding in compression.available_encodings()
+        for level in args.levels
+    ]
+
+    try:
+        current = 0
+        for size in sorted(args.sizes):
+            seed_users(path, current + 1, size + 1)
+            seed_blog_posts(path, current + 1, size + 1, size, sentences=5)
+            current = size
+            print(f"\n{size} users and posts")
+            print(f"{'endpoint':<34}{'encoding':<12}{'bytes':>12}{'ratio':>8}"
+                  f"{'ms':>10}{'ms + wire':>12}")
+            for url in ENDPOINTS:
+                plain = None
+                for encoding, level in runs:
+                    latency, size_bytes = measure(clients[level], url, encoding, args.requests)
+                    plain = plain or size_bytes
+                    wire = size_bytes * 8 / (args.mbps * 1e6) * 1000
+                    label = encoding if encoding == "identity" else f"{encoding}-{level}"
+                    print(f"{url:<34}{label:<12}{size_bytes:>12}{plain / size_bytes:>8.2f}"
+                          f"{latency:>10.2f}{latency + wire:>12.2f}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
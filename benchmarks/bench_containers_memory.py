@@ -0,0 +1,79 @@
+"""Memory per element of LinkedList and Queue, measured with tracemalloc,
+against the dict-based nodes they used to allocate and the built-in
+list and deque.
+
+    python -m benchmarks.bench_containers_memory [--sizes 1000 100000 1000000]
+"""
+import argparse
+import collections
+import gc
+import tracemalloc
+
+from custom_queue import Queue
+from linked_list import LinkedList
+
+
+class _DictNode:
+    """A node as both modules used to define it: no `__slots__`, so every
+    instance carries its own attribute dict.
+    """
+
+    def __init__(self, data=None, next_=None):
+        self.data = data
+        self.next_ = next_
+
+
+def old_linked_list(items):
+    """What LinkedList.insert_at_end used to build, one _DictNode each."""
+    head = tail = None
+    for data in items:
+        node = _DictNode(data)
+        if head is None:
+            head = tail = node
+        else:
+            tail.next_ = tail = node
+    return head
+
+
+CANDIDATES = {
+    "dict nodes (old LinkedList/Queue)": old_linked_list,
+    "LinkedList": LinkedList.from_iterable,
+    "LinkedList, id index": lambda items: LinkedList.from_iterable(items, index_key="id"),
+    "Queue": Queue.from_iterable,
+    "Queue, id index": lambda items: Queue.from_iterable(items, index_key="id"),
+    "list": list,
+    "collections.deque": collections.deque,
+}
+
+
+def bytes_per_item(build, items):
+    """Bytes allocated by `build(items)` and still alive, per item. The
+    items themselves exist beforehand, so only the container is counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    container = build(items)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del container
+    return (after - before) / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'size':>10}  {'container':<36}{'bytes/item':>12}")
+    for size in args.sizes:
+        items = [{"id": i} for i in range(size)]
+        baseline = None
+        for name, build in CANDIDATES.items():
+            per_item = bytes_per_item(build, items)
+            baseline = baseline or per_item
+            print(f"{size:>10,}  {name:<36}{per_item:>12.1f}  {per_item / baseline:6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Latency of GET /user/<user_id> as the user table grows.
+
+The table is grown in place from 200 to 1M users, and at each size a
+batch of random ids (plus a few misses) is fetched through the Flask
+test client. With the primary key lookup the numbers should stay flat.
+
+    python -m benchmarks.bench_get_one_user [--sizes 200 10000 1000000]
+"""
+import argparse
+import os
+import random
+
+from benchmarks.common import seed_users, summarize, temp_database_url, time_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=[200, 10_000, 100_000, 1_000_000],
+    )
+    parser.add_argument("--requests", type=int, default=2_000)
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    import server
+
+    # the app reads DATABASE_URL when it is created, on first use
+    with server.app.app_context():
+        server.init_db()
+    client = server.app.test_client()
+
+    try:
+        current = 0
+        for size in sorted(args.sizes):
+            seed_users(path, current + 1, size + 1)
+            current = size
+
+            ids = [random.randint(1, size) for _ in range(args.requests)]
+            ids += [size + 1 + i for i in range(args.requests // 100)]
+            urls = iter(f"/user/{user_id}" for user_id in ids)
+
+            # warm up the connection pool and page cache
+            client.get("/user/1")
+            latencies = time_calls(lambda: client.get(next(urls)), len(ids))
+            print(f"{size:>10,} users  {summarize(latencies)}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""HashTable against the built-in dict for insert, get and delete.
+
+    python -m benchmarks.bench_hash_table [--sizes 1000 100000 10000000]
+"""
+import argparse
+import random
+import time
+
+from hash_table import HashTable
+
+
+def run(factory, keys, lookups):
+    """Time inserting every key, looking up `lookups`, then deleting every
+    key. Returns the per-operation time in ns for each phase.
+    """
+    table = factory()
+    start = time.perf_counter()
+    for key in keys:
+        table[key] = key
+    inserted = time.perf_counter()
+    for key in lookups:
+        table[key]
+    looked_up = time.perf_counter()
+    for key in keys:
+        del table[key]
+    deleted = time.perf_counter()
+    n = len(keys)
+    return (
+        (inserted - start) / n * 1e9,
+        (looked_up - inserted) / len(lookups) * 1e9,
+        (deleted - looked_up) / n * 1e9,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="add 10000000 for the full range (needs several GB of RAM)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>12} {'impl':<10}{'insert':>12}{'get':>12}{'delete':>12}  (ns/op)")
+    for size in args.sizes:
+        keys = [f"key-{i}" for i in range(size)]
+        rng.shuffle(keys)
+        lookups = rng.sample(keys, min(size, 100_000))
+        for name, factory in (("dict", dict), ("HashTable", HashTable)):
+            insert, get, delete = run(factory, keys, lookups)
+            print(f"{size:>12,} {name:<10}{insert:>12.0f}{get:>12.0f}{delete:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
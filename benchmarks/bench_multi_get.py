@@ -0,0 +1,106 @@
+"""Multi-get against one request per id, and request coalescing under a
+thundering herd.
+
+With the cache off, so every request reaches SQLite, this times fetching
+`--batch` users or posts with one GET /user?ids=... or /blog_post?ids=...
+against one GET /user/<id> or /blog_post/<id> each. Then `--threads`
+threads request the same user at once, round after round, and the
+number of loads shows how many of them shared one fetch.
+
+    python -m benchmarks.bench_multi_get [--batch 50] [--threads 16]
+"""
+import argparse
+import os
+import random
+import threading
+
+from benchmarks.common import (
+    seed_blog_posts, seed_users, summarize, temp_database_url, time_calls
+)
+
+USERS = 10_000
+POSTS = 10_000
+
+
+def herd(app, threads, rounds):
+    """Latencies of `rounds` rounds of `threads` simultaneous requests for
+    one user, and the number of loads they caused.
+    """
+    flights = app.extensions["api"].cache.flights
+    loads_before = flights.loads
+    barrier = threading.Barrier(threads)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(user_ids):
+        test_client = app.test_client()
+        for user_id in user_ids:
+            barrier.wait()
+            result = time_calls(lambda: test_client.get(f"/user/{user_id}"), 1)
+            with lock:
+                latencies.extend(result)
+
+    user_ids = [random.randint(1, USERS) for _ in range(rounds)]
+    workers = [threading.Thread(target=client, args=(user_ids,)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, flights.loads - loads_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=50, help="ids per multi-get")
+    parser.add_argument("--requests", type=int, default=200, help="batches timed")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    os.environ["CACHE_BACKEND"] = "none"
+    import server
+
+    with server.app.app_context():
+        server.init_db()
+    server.app.logger.disabled = True
+    client = server.app.test_client()
+    seed_users(path, 1, USERS + 1)
+    seed_blog_posts(path, 1, POSTS + 1, USERS, sentences=20)
+
+    try:
+        for name, count in (("user", USERS), ("blog_post", POSTS)):
+            batches = [
+                [random.randint(1, count) for _ in range(args.batch)]
+                for _ in range(args.requests)
+            ]
+            # warm up the connection pool and the page cache
+            client.get(f"/{name}/1")
+            client.get(f"/{name}?ids=1")
+
+            singles = iter(batches)
+            single = time_calls(
+                lambda: [client.get(f"/{name}/{id_}") for id_ in next(singles)],
+                args.requests,
+            )
+            multis = iter(batches)
+            multi = time_calls(
+                lambda: client.get(f"/{name}?ids={','.join(map(str, next(multis)))}"),
+                args.requests,
+            )
+            print(f"{f'{args.batch} {name}s, one request each':<34}{summarize(single)}")
+            print(f"{f'{args.batch} {name}s, one multi-get':<34}{summarize(multi)}")
+
+        latencies, loads = herd(server.app, args.threads, args.rounds)
+        print(
+            f"\nherd of {args.threads} threads x {args.rounds} rounds: "
+            f"{loads} loads for {len(latencies)} requests\n  {summarize(latencies)}"
+        )
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Numeric body checksum: the old per-character loop against the
+precomputed and vectorized versions, on 190-sentence Faker bodies.
+
+    python -m benchmarks.bench_numeric_body [--posts 2000]
+"""
+import argparse
+import time
+
+from faker import Faker
+
+import checksum
+import custom_queue
+
+
+class _Post:
+    def __init__(self, body):
+        self.body = body
+
+
+def old_loop(posts):
+    """What `get_numeric_post_bodies` used to do for every request."""
+    q = custom_queue.Queue()
+    for post in posts:
+        q.enqueue(post)
+    sums = []
+    for _ in range(len(posts)):
+        post = q.dequeue()
+        numeric_body = 0
+        for char in post.body:
+            numeric_body += ord(char)
+        sums.append(numeric_body)
+    return sums
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    faker = Faker()
+    Faker.seed(args.seed)
+    bodies = [faker.paragraph(190) for _ in range(args.posts)]
+    posts = [_Post(body) for body in bodies]
+    print(
+        f"{args.posts} bodies, mean length "
+        f"{sum(map(len, bodies)) // len(bodies)} characters"
+    )
+
+    old_ms, expected = best_of(lambda: old_loop(posts))
+    candidates = [
+        ("per-body numeric_body", lambda: [checksum.numeric_body(b) for b in bodies]),
+        ("bulk numeric_bodies", lambda: checksum.numeric_bodies(bodies)),
+    ]
+    print(f"{'queue + ord loop':<24}{old_ms:10.2f} ms")
+    for name, func in candidates:
+        elapsed, result = best_of(func)
+        assert result == expected, name
+        print(f"{name:<24}{elapsed:10.2f} ms  {old_ms / elapsed:7.1f}x")
+    print(f"numpy {'enabled' if checksum.load_numpy() is not None else 'not installed'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Latency of GET /blog_post/search as the number of posts grows.
+
+Posts have 190-sentence bodies over a vocabulary of a few thousand
+words, so a single word matches a sizeable share of them and each extra
+word narrows the match. Each query shape is timed through the Flask test
+client, first page and a later page reached through the keyset cursor.
+
+    python -m benchmarks.bench_search [--sizes 1000 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+
+from benchmarks.common import seed_blog_posts, seed_users, summarize, temp_database_url, time_calls
+
+VOCABULARY = [f"word{i}" for i in range(5_000)]
+
+QUERIES = {
+    "one word": 1,
+    "two words": 2,
+    "three words": 3,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000],
+        help="add 1000000 for the full range (needs about 8 GB of disk)",
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    import server
+
+    # the app reads DATABASE_URL when it is created, on first use
+    with server.app.app_context():
+        server.init_db()
+    client = server.app.test_client()
+    rng = random.Random(0)
+    seed_users(path, 1, 1001)
+
+    try:
+        current = 0
+        for size in sorted(args.sizes):
+            # the triggers index the new posts as they are inserted
+            seed_blog_posts(
+                path, current + 1, size + 1, 1000,
+                words=VOCABULARY, sentence_pool=20_000,
+            )
+            current = size
+            with server.app.app_context():
+                server.reindex_search()  # merge the index segments
+
+            for name, words in QUERIES.items():
+                queries = iter([
+                    " ".join(rng.sample(VOCABULARY, words)) for _ in range(args.requests)
+                ])
+                latencies = time_calls(
+                    lambda: client.get("/blog_post/search", query_string={"q": next(queries)}),
+                    args.requests,
+                )
+                print(f"{size:>10,} posts  {name:<12} first page  {summarize(latencies)}")
+
+                links = []
+                for _ in range(args.requests):
+                    response = client.get(
+                        "/blog_post/search",
+                        query_string={"q": " ".join(rng.sample(VOCABULARY, words))},
+                    )
+                    link = response.headers.get("Link")
+                    if link:
+                        links.append(link[1:link.index(">")])
+                if links:
+                    pages = iter(links)
+                    latencies = time_calls(lambda: client.get(next(pages)), len(links))
+                    print(f"{size:>10,} posts  {name:<12} next page   {summarize(latencies)}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Write throughput and listing latency with the store split into shards.
+
+For each shard count a scratch database is seeded, spread over the
+shards with `flask reshard`, and served by `serve.py` with several
+worker processes. Writer threads then create blog posts for random users
+over keep-alive connections while reader threads page through
+/user/ascending_id, which has to merge the pages of every shard.
+
+    python -m benchmarks.bench_sharding [--shards 1 2 4] [--workers 4] \\
+        [--writers 8 --readers 2 --seconds 5] [--users 10000]
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import percentile, seed_users, temp_database_url
+from benchmarks.load_test import ROOT, free_port, start_server, stop_server
+
+
+def hammer(port, users, writers, readers, seconds):
+    """Requests/s and p50/p99 latency of the writes and of the reads."""
+    deadline = time.perf_counter() + seconds
+    results = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def client(kind):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies, failed = [], 0
+        while time.perf_counter() < deadline:
+            user_id = random.randint(1, users)
+            start = time.perf_counter()
+            if kind == "write":
+                connection.request(
+                    "POST", f"/blog_post/{user_id}",
+                    json.dumps({"title": "Load test", "body": "Sharded write " * 8}),
+                    {"Content-Type": "application/json"},
+                )
+            else:
+                connection.request("GET", f"/user/ascending_id?after_id={user_id}&limit=50")
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            failed += response.status >= 500
+        connection.close()
+        with lock:
+            results[kind] += latencies
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=client, args=("write",)) for _ in range(writers)]
+    threads += [threading.Thread(target=client, args=("read",)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        kind: {
+            "requests_per_s": len(latencies) / seconds,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else float("nan"),
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else float("nan"),
+            "errors": errors[kind],
+        }
+        for kind, latencies in results.items()
+    }
+
+
+def run(shards, args):
+    path = temp_database_url()
+    url = os.environ["DATABASE_URL"]
+    env = dict(os.environ, SHARDS=str(shards), CACHE_BACKEND="none")
+    try:
+        # create the schema of every shard, then move the seeded users
+        # from the first shard to their own
+        subprocess.run(
+            [sys.executable, "-m", "flask", "--app", "server", "reshard", "--from", "1"],
+            cwd=ROOT, env=env, check=True, capture_output=True,
+        )
+        seed_users(path, 1, args.users + 1)
+        subprocess.run(
+            [sys.executable, "-m", "flask", "--app", "server", "reshard", "--from", "1"],
+            cwd=ROOT, env=env, check=True, capture_output=True,
+        )
+        port = free_port()
+        process = start_server(
+            url, port, args.workers, args.threads,
+            extra_env={"SHARDS": str(shards), "CACHE_BACKEND": "none"},
+        )
+        try:
+            return hammer(port, args.users, args.writers, args.readers, args.seconds)
+        finally:
+            stop_server(process)
+    finally:
+        base, extension = os.path.splitext(path)
+        for name in [path] + glob.glob(f"{base}-shard*{extension}"):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(name + suffix):
+                    os.remove(name + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} {'kind':<6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for shards in args.shards:
+        for kind, result in run(shards, args).items():
+            print(
+                f"{shards:>6} {kind:<6}{result['requests_per_s']:>10.1f}"
+                f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
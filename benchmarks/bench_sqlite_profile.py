@@ -0,0 +1,130 @@
+"""Concurrent read/write throughput under each SQLite storage profile.
+
+Every profile runs in its own process against a fresh database: reader
+threads fetch single users and pages of the user listing while writer
+threads create users, all through the Flask test client.
+
+    python -m benchmarks.bench_sqlite_profile [--readers 8 --writers 2 --seconds 5]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import storage
+from benchmarks.common import percentile, seed_users, temp_database_url
+
+
+def run_profile(args):
+    """Body of the child process: load the app under one profile, hammer it
+    and print the results as one JSON line.
+    """
+    path = temp_database_url()
+    os.environ["SQLITE_PROFILE"] = args.run_profile
+    import server
+
+    # the app reads DATABASE_URL and SQLITE_PROFILE when it is created
+    with server.app.app_context():
+        server.init_db()
+    server.app.logger.disabled = True
+    seed_users(path, 1, args.users + 1)
+
+    deadline = time.perf_counter() + args.seconds
+    results = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+
+    def reader():
+        client = server.app.test_client()
+        latencies, failed = [], 0
+        while time.perf_counter() < deadline:
+            user_id = random.randint(1, args.users)
+            if random.random() < 0.8:
+                url = f"/user/{user_id}"
+            else:
+                url = f"/user/ascending_id?after_id={user_id}&limit=50"
+            start = time.perf_counter()
+            status = client.get(url).status_code
+            latencies.append(time.perf_counter() - start)
+            failed += status >= 500
+        with lock:
+            results["read"] += latencies
+            errors["read"] += failed
+
+    def writer():
+        client = server.app.test_client()
+        latencies, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = client.post("/user", json={
+                "name": "Load Test", "email": "load@test.com",
+                "address": "1 Test Street", "phone": "000",
+            }).status_code
+            latencies.append(time.perf_counter() - start)
+            failed += status >= 500
+        with lock:
+            results["write"] += latencies
+            errors["write"] += failed
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = {}
+    for kind, latencies in results.items():
+        summary[kind] = {
+            "ops_per_s": len(latencies) / args.seconds,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+            "errors": errors[kind],
+        }
+    os.remove(path)
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=list(storage.PROFILES))
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        run_profile(args)
+        return
+
+    print(
+        f"{args.readers} readers, {args.writers} writers, {args.seconds}s, "
+        f"{args.users:,} users"
+    )
+    print(f"{'profile':<10}{'kind':<7}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for profile in args.profiles:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_profile",
+             "--run-profile", profile, "--users", str(args.users),
+             "--readers", str(args.readers), "--writers", str(args.writers),
+             "--seconds", str(args.seconds)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        summary = json.loads(output.strip().splitlines()[-1])
+        for kind, stats in summary.items():
+            p50 = f"{stats['p50_ms']:.2f}" if stats["p50_ms"] is not None else "-"
+            p99 = f"{stats['p99_ms']:.2f}" if stats["p99_ms"] is not None else "-"
+            print(
+                f"{profile:<10}{kind:<7}{stats['ops_per_s']:>10.0f}"
+                f"{p50:>10}{p99:>10}{stats['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
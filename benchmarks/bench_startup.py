@@ -0,0 +1,113 @@
+"""Startup cost of the app: import time and time to the first request.
+
+Every measurement runs in a fresh interpreter. `python -X importtime`
+gives the time to import `server` and its heaviest direct imports. A
+second script times `import server`, `create_app()` and the first two
+GET /user/1 through the test client; the first request also brings the
+schema up to date, creating it on a new database ("cold").
+
+    python -m benchmarks.bench_startup [--runs 10] [--top 8]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import seed_users, temp_database_url
+from benchmarks.load_test import ROOT
+
+FIRST_REQUEST = """
+import time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+app = server.create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get("/user/1")
+first = time.perf_counter()
+client.get("/user/1")
+second = time.perf_counter()
+print(imported - start, created - imported, first - created, second - first)
+"""
+
+PHASES = ("import", "create_app", "first request", "second request", "process")
+
+
+def import_times(module="server"):
+    """{module: cumulative import time in ms} for the modules imported
+    directly by `module`, and `module` itself.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    # a module is listed after everything it imports, one level deeper
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1000
+        elif depth == 0:
+            if name.strip() == module:
+                return {**children, module: int(cumulative) / 1000}
+            children = {}
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def first_request():
+    """Seconds spent in each phase of `FIRST_REQUEST`, and in the whole
+    process including interpreter startup.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    process = time.perf_counter() - start
+    return [float(value) for value in result.stdout.split()] + [process]
+
+
+def print_phases(label, runs):
+    print(label)
+    for phase, values in zip(PHASES, zip(*runs)):
+        print(f"  {phase:<16}{statistics.median(values) * 1000:10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="warm runs, medians are shown")
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports to list")
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    try:
+        print_phases("cold (new database)", [first_request()])
+        seed_users(path, 1, 1001)
+        print_phases(
+            f"warm (median of {args.runs})",
+            [first_request() for _ in range(args.runs)],
+        )
+
+        times = [import_times() for _ in range(args.runs)]
+        total = statistics.median(run.pop("server") for run in times)
+        print(f"\nimport server {total:10.1f} ms, heaviest imports:")
+        medians = {
+            name: statistics.median(run.get(name, 0) for run in times)
+            for name in times[0]
+        }
+        for name, ms in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {name:<24}{ms:10.1f} ms")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
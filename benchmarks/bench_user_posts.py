@@ -0,0 +1,77 @@
+"""Latency of the per-user post endpoints as the blog post table grows:
+the first and a later page of GET /user/<id>/blog_posts,
+GET /user/<id>?include=posts and DELETE /user/<id>.
+
+Posts are spread over 1000 users, so each user has about posts/1000 of
+them. With the (user_id, date, id) index the pages should stay flat and
+the other two should grow with the posts of one user, not of the table.
+
+    python -m benchmarks.bench_user_posts [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+
+from benchmarks.common import seed_blog_posts, seed_users, summarize, temp_database_url, time_calls
+
+USERS = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sentences", type=int, default=5, help="sentences per post body")
+    args = parser.parse_args()
+
+    path = temp_database_url()
+    import server
+
+    # the app reads DATABASE_URL when it is created, on first use
+    with server.app.app_context():
+        server.init_db()
+    client = server.app.test_client()
+    rng = random.Random(0)
+    seed_users(path, 1, USERS + 1)
+
+    try:
+        current = 0
+        for size in sorted(args.sizes):
+            seed_blog_posts(path, current + 1, size + 1, USERS, sentences=args.sentences)
+            current = size
+
+            users = iter([rng.randint(1, USERS) for _ in range(args.requests)])
+            latencies = time_calls(
+                lambda: client.get(f"/user/{next(users)}/blog_posts?limit=20"), args.requests
+            )
+            print(f"{size:>10,} posts  first page     {summarize(latencies)}")
+
+            links = [
+                client.get(f"/user/{rng.randint(1, USERS)}/blog_posts?limit=5").headers.get("Link")
+                for _ in range(args.requests)
+            ]
+            pages = iter([link[1:link.index(">")] for link in links if link])
+            latencies = time_calls(lambda: client.get(next(pages)), sum(map(bool, links)))
+            print(f"{size:>10,} posts  next page      {summarize(latencies)}")
+
+            users = iter([rng.randint(1, USERS) for _ in range(args.requests)])
+            latencies = time_calls(
+                lambda: client.get(f"/user/{next(users)}?include=posts"), args.requests
+            )
+            print(f"{size:>10,} posts  include=posts  {summarize(latencies)}")
+
+            # delete a few users, then put them back for the next size
+            deleted = rng.sample(range(1, USERS + 1), 10)
+            users = iter(deleted)
+            latencies = time_calls(lambda: client.delete(f"/user/{next(users)}"), len(deleted))
+            print(f"{size:>10,} posts  delete user    {summarize(latencies)}")
+            for user_id in deleted:
+                seed_users(path, user_id, user_id + 1)
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+
+def temp_database_url():
+    """Point the app at a throwaway SQLite file. Must be called before
+    `server.app` is first used, because the app reads `DATABASE_URL` when
+    it is created.
+    """
+    fd, path = tempfile.mkstemp(prefix="bench_", suffix=".sqlite")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+def seed_users(path, start_id, stop_id, batch_size=50_000):
+    """Bulk insert cheap synthetic users with ids in [start_id, stop_id).
+    Faker is far too slow for millions of rows, and the benchmarks only
+    care about the table size, not the realism of the data.
+    """
+    connection = sqlite3.connect(path)
+    with connection:
+        for batch_start in range(start_id, stop_id, batch_size):
+            batch_stop = min(batch_start + batch_size, stop_id)
+            connection.executemany(
+                "INSERT INTO user (id, name, email, address, phone) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        i,
+                        f"User {i}",
+                        f"User_{i}@email.com",
+                        f"{i} Benchmark Street",
+                        f"{i:012d}",
+                    )
+                    for i in range(batch_start, batch_stop)
+                ),
+            )
+    connection.close()
+
+
+def time_calls(func, repeat):
+    """Call `func` `repeat` times and return the latencies in ms."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """Return mean, p50 and p99 latency as a formatted string."""
+    return (
+        f"mean {statistics.mean(latencies):8.3f} ms  "
+        f"p50 {percentile(latencies, 50):8.3f} ms  "
+        f"p99 {percentile(latencies, 99):8.3f} ms"
+    )
+
+
+_WORDS = (
+    "time person year way day thing man world life hand part child eye "
+    "woman place work week case point government company number group "
+    "problem fact"
+).split()
+
+
+def seed_blog_posts(path, start_id, stop_id, users, sentences=190, batch_size=10_000,
+                    words=_WORDS, sentence_pool=1000):
+    """Bulk insert synthetic posts with ids in [start_id, stop_id), spread
+    over user ids 1..users. Bodies have `sentences` short sentences, like
+    the Faker bodies of the dummy data generator, drawn from a pool of
+    `sentence_pool` sentences made of `words`.
+    """
+    import checksum
+
+    rng = random.Random(start_id)
+    sentence_pool = [
+        " ".join(rng.choices(words, k=6)).capitalize() + "."
+        for _ in range(sentence_pool)
+    ]
+    connection = sqlite3.connect(path)
+    with connection:
+        for batch_start in range(start_id, stop_id, batch_size):
+            rows = []
+            for i in range(batch_start, min(batch_start + batch_size, stop_id)):
+                body = " ".join(rng.choices(sentence_pool, k=sentences))
+                rows.append((
+                    i, f"Post {i}", body, "2021-05-18",
+                    rng.randint(1, users), checksum.numeric_body(body),
+                ))
+            connection.executemany(
+                "INSERT INTO blog_post (id, title, body, date, user_id, numeric_body) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+    connection.close()
@@ -0,0 +1,202 @@
+"""Load test of the API served by `serve.py`, as the number of worker
+processes grows.
+
+For each worker count a server is started on a seeded scratch database,
+then every endpoint is hammered in turn by client processes over
+keep-alive HTTP connections, reporting requests/s and p50/p99 latency.
+
+    python -m benchmarks.load_test [--workers 1 2 4] [--threads 8] \\
+        [--clients 2 --connections 8 --seconds 5] [--users 10000 --posts 2000]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import percentile, seed_blog_posts, seed_users, temp_database_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RandomPath:
+    """Request path with `{n}` replaced by a random id in [low, high].
+    A class rather than a lambda so it can be sent to client processes.
+    """
+
+    def __init__(self, template, low=1, high=1):
+        self.template = template
+        self.low = low
+        self.high = high
+
+    def __call__(self):
+        return self.template.format(n=random.randint(self.low, self.high))
+
+
+def endpoints(users, posts):
+    """Endpoint name -> RandomPath."""
+    return {
+        "GET /user/<id>": RandomPath("/user/{n}", 1, users),
+        "GET /user/ascending_id page": RandomPath(
+            "/user/ascending_id?after_id={n}&limit=50", 0, users
+        ),
+        "GET /blog_post/<id>": RandomPath("/blog_post/{n}", 1, posts),
+        "GET /blog_post/range": RandomPath("/blog_post/range?start={n}&limit=20", 1, posts),
+        "GET /blog_post/numeric_body": RandomPath("/blog_post/numeric_body"),
+    }
+
+
+def start_server(database_url, port, workers, threads, extra_env=None):
+    """Start `serve.py` and wait until it accepts connections."""
+    env = dict(os.environ, DATABASE_URL=database_url, **(extra_env or {}))
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads)],
+        cwd=ROOT, env=env, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        process.kill()
+        raise RuntimeError("server did not start")
+    # let every worker finish importing the app before measuring
+    time.sleep(0.5 + 0.3 * workers)
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=60)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _client(task):
+    """One client process: `connections` threads, each sending requests
+    on its own keep-alive connection until the deadline. Returns the
+    latencies in seconds and the number of failed requests.
+    """
+    port, make_path, connections, deadline, seed = task
+    random.seed(seed)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def run():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine = []
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", make_path())
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            mine.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def hammer(port, make_path, clients, connections, seconds):
+    """Run the client processes against one endpoint and summarize."""
+    # time.time(), not perf_counter(): the deadline is shared between processes
+    deadline = time.time() + seconds
+    tasks = [(port, make_path, connections, deadline, i) for i in range(clients)]
+    with multiprocessing.get_context("fork").Pool(clients) as pool:
+        results = pool.map(_client, tasks)
+    latencies = [latency for result in results for latency in result[0]]
+    return {
+        "requests_per_s": len(latencies) / seconds,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else float("nan"),
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else float("nan"),
+        "errors": sum(result[1] for result in results),
+    }
+
+
+def seeded_database(users, posts):
+    """Create and fill a scratch database, returning its path and URL."""
+    path = temp_database_url()
+    import server
+
+    with server.app.app_context():
+        server.init_db()  # creates the schema in the scratch database
+    seed_users(path, 1, users + 1)
+    seed_blog_posts(path, 1, posts + 1, users)
+    return path, os.environ["DATABASE_URL"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cpus = os.cpu_count() or 1
+    parser.add_argument(
+        "--workers", type=int, nargs="+",
+        default=sorted({1, 2, 4, cpus} - {n for n in (2, 4) if n > cpus}),
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=2, help="client processes")
+    parser.add_argument("--connections", type=int, default=8, help="connections per client")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=2_000)
+    parser.add_argument("--only", nargs="+", help="endpoint names to run")
+    args = parser.parse_args()
+
+    path, database_url = seeded_database(args.users, args.posts)
+    targets = endpoints(args.users, args.posts)
+    if args.only:
+        targets = {name: targets[name] for name in args.only}
+
+    print(
+        f"{args.users:,} users, {args.posts:,} posts; {args.clients} clients x "
+        f"{args.connections} connections, {args.seconds}s per endpoint"
+    )
+    print(f"{'workers':>7}  {'endpoint':<30}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    try:
+        for workers in args.workers:
+            port = free_port()
+            server = start_server(database_url, port, workers, args.threads)
+            try:
+                for name, make_path in targets.items():
+                    stats = hammer(port, make_path, args.clients, args.connections, args.seconds)
+                    print(
+                        f"{workers:>7}  {name:<30}{stats['requests_per_s']:>10.0f}"
+                        f"{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+                    )
+            finally:
+                stop_server(server)
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Microbenchmarks of the data structure modules: linked_list,
+hash_table, binary_search_tree and custom_queue.
+
+Each case builds its input outside the timed region and reports the best
+of `--repeat` runs in ns per operation.
+
+    python -m benchmarks.micro [--size 10000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+
+from binary_search_tree import BinarySearchTree
+from custom_queue import Queue
+from hash_table import HashTable
+from linked_list import LinkedList
+
+
+def _records(size, seed=0):
+    ids = list(range(1, size + 1))
+    random.Random(seed).shuffle(ids)
+    return [{"id": i, "title": f"Post {i}"} for i in ids]
+
+
+def linked_list_insert_at_end(size):
+    records = _records(size)
+
+    def run():
+        linked_list = LinkedList()
+        for record in records:
+            linked_list.insert_at_end(record)
+        return size
+
+    return run
+
+
+def linked_list_insert_beginning(size):
+    records = _records(size)
+
+    def run():
+        linked_list = LinkedList()
+        for record in records:
+            linked_list.insert_beginning(record)
+        return size
+
+    return run
+
+
+def linked_list_extend(size):
+    records = _records(size)
+
+    def run():
+        LinkedList.from_iterable(records)
+        return size
+
+    return run
+
+
+def linked_list_to_list(size):
+    linked_list = LinkedList()
+    for record in _records(size):
+        linked_list.insert_at_end(record)
+
+    def run():
+        linked_list.to_list()
+        return size
+
+    return run
+
+
+def linked_list_get_user_by_id(size):
+    linked_list = LinkedList()
+    for record in _records(size):
+        linked_list.insert_at_end(record)
+    # a linear scan each, so only a few lookups
+    rng = random.Random(1)
+    lookups = [rng.randint(1, size) for _ in range(20)]
+
+    def run():
+        for user_id in lookups:
+            linked_list.get_user_by_id(user_id)
+        return len(lookups)
+
+    return run
+
+
+def linked_list_get_user_by_id_indexed(size):
+    linked_list = LinkedList.from_iterable(_records(size), index_key="id")
+    rng = random.Random(1)
+    lookups = [rng.randint(1, size) for _ in range(size)]
+
+    def run():
+        for user_id in lookups:
+            linked_list.get_user_by_id(user_id)
+        return len(lookups)
+
+    return run
+
+
+def hash_table_set(size):
+    keys = [f"key-{record['id']}" for record in _records(size)]
+
+    def run():
+        table = HashTable()
+        for key in keys:
+            table.add_key_value(key, key)
+        return size
+
+    return run
+
+
+def hash_table_get(size):
+    keys = [f"key-{record['id']}" for record in _records(size)]
+    table = HashTable()
+    for key in keys:
+        table.add_key_value(key, key)
+
+    def run():
+        for key in keys:
+            table.get_value(key)
+        return size
+
+    return run
+
+
+def hash_table_delete(size):
+    keys = [f"key-{record['id']}" for record in _records(size)]
+    tables = []
+
+    def setup():
+        table = HashTable()
+        for key in keys:
+            table.add_key_value(key, key)
+        tables.append(table)
+
+    def run():
+        table = tables.pop()
+        for key in keys:
+            table.delete_key(key)
+        return size
+
+    run.setup = setup
+    return run
+
+
+def bst_insert(size):
+    records = _records(size)
+
+    def run():
+        tree = BinarySearchTree()
+        for record in records:
+            tree.insert(record)
+        return size
+
+    return run
+
+
+def bst_search(size):
+    records = _records(size)
+    tree = BinarySearchTree()
+    for record in records:
+        tree.insert(record)
+
+    def run():
+        for record in records:
+            tree.search(record["id"])
+        return size
+
+    return run
+
+
+def queue_enqueue(size):
+    records = _records(size)
+
+    def run():
+        queue = Queue()
+        for record in records:
+            queue.enqueue(record)
+        return size
+
+    return run
+
+
+def queue_extend(size):
+    records = _records(size)
+
+    def run():
+        Queue.from_iterable(records)
+        return size
+
+    return run
+
+
+def queue_dequeue(size):
+    records = _records(size)
+    queues = []
+
+    def setup():
+        queues.append(Queue.from_iterable(records))
+
+    def run():
+        queue = queues.pop()
+        for _ in range(size):
+            queue.dequeue()
+        return size
+
+    run.setup = setup
+    return run
+
+
+CASES = {
+    "linked_list.insert_at_end": linked_list_insert_at_end,
+    "linked_list.insert_beginning": linked_list_insert_beginning,
+    "linked_list.extend": linked_list_extend,
+    "linked_list.to_list": linked_list_to_list,
+    "linked_list.get_user_by_id": linked_list_get_user_by_id,
+    "linked_list.get_user_by_id (indexed)": linked_list_get_user_by_id_indexed,
+    "hash_table.add_key_value": hash_table_set,
+    "hash_table.get_value": hash_table_get,
+    "hash_table.delete_key": hash_table_delete,
+    "binary_search_tree.insert": bst_insert,
+    "binary_search_tree.search": bst_search,
+    "custom_queue.enqueue": queue_enqueue,
+    "custom_queue.extend": queue_extend,
+    "custom_queue.dequeue": queue_dequeue,
+}
+
+
+def measure(case, size, repeat):
+    """Best time of `repeat` runs of `case`, in ns per operation. A case
+    whose run consumes its input has a `setup` called before each run,
+    outside the timing.
+    """
+    run = case(size)
+    best = float("inf")
+    for _ in range(repeat):
+        if hasattr(run, "setup"):
+            run.setup()
+        start = time.perf_counter()
+        operations = run()
+        best = min(best, (time.perf_counter() - start) / operations * 1e9)
+    return best
+
+
+def run_all(size=10_000, repeat=5, only=None):
+    """{case name: ns per operation}"""
+    return {
+        name: measure(case, size, repeat)
+        for name, case in CASES.items()
+        if not only or any(part in name for part in only)
+    }
+
+
+def print_results(results, title=None):
+    if title:
+        print(title)
+    print(f"{'case':<42}{'ns/op':>12}")
+    for name, ns in results.items():
+        print(f"{name:<42}{ns:>12.0f}")
+
+
+def add_arguments(parser):
+    parser.add_argument("--size", type=int, default=10_000, help="items per structure")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="run the cases containing these names")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    print_results(
+        run_all(args.size, args.repeat, args.only),
+        f"{args.size:,} items, best of {args.repeat}",
+    )
+
+
+if __name__ == "__main__":
+    main()
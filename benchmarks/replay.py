@@ -0,0 +1,311 @@
+"""Replay a JSONL request mix against the app and report, per route,
+throughput, latency percentiles and peak RSS.
+
+Each line of the mix is one request template:
+
+    {"method": "GET", "path": "/user/{user_id}", "weight": 30}
+    {"method": "POST", "path": "/blog_post/{user_id}", "json": {...}, "weight": 3}
+
+`{user_id}` and `{post_id}` are filled with random ids of the seeded
+data. Every route is measured on its own, followed by the whole mix
+with requests drawn according to their weights.
+
+With `--target client` each route runs in a fresh process through the
+Flask test client, so its peak RSS is that of the process. With
+`--target server` a fresh `serve.py` is started per route and the peak
+RSS is that of its worker processes (read from /proc, Linux only).
+
+    python -m benchmarks.replay [--mix benchmarks/request_mix.jsonl] \\
+        [--target client|server] [--users 10000 --posts 2000] [--seconds 3]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import percentile
+from benchmarks.load_test import free_port, seeded_database, start_server, stop_server
+
+DEFAULT_MIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_mix.jsonl")
+
+MIX_ROUTE = "ALL (weighted mix)"
+
+
+def load_mix(path):
+    """Read the request templates of a JSONL mix file."""
+    with open(path) as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    for entry in entries:
+        entry.setdefault("method", "GET")
+        entry.setdefault("weight", 1)
+    return entries
+
+
+def route_name(entry):
+    return f"{entry['method']} {entry['path']}"
+
+
+class RequestFactory:
+    """Draws concrete requests (method, path, JSON body) from templates."""
+
+    def __init__(self, entries, users, posts, seed=0):
+        self.entries = entries
+        self.weights = [entry["weight"] for entry in entries]
+        self.users = users
+        self.posts = posts
+        self.rng = random.Random(seed)
+
+    def __call__(self):
+        entry = self.rng.choices(self.entries, self.weights)[0]
+        path = entry["path"].format(
+            user_id=self.rng.randint(1, self.users),
+            post_id=self.rng.randint(1, self.posts),
+        )
+        return entry["method"], path, entry.get("json")
+
+
+def _peak_rss_mb_self():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _peak_rss_mb_children(pid):
+    """Largest VmHWM among the worker processes of the server `pid`, or
+    None where /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            children = [int(child) for child in file.read().split()]
+        peaks = []
+        for child in children:
+            with open(f"/proc/{child}/status") as file:
+                for line in file:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]) / 1024)
+        return max(peaks) if peaks else None
+    except OSError:
+        return None
+
+
+def summarize(latencies, errors, seconds, peak_rss_mb):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_s": len(latencies) / seconds,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def run_client(entries, users, posts, seconds):
+    """Replay through the Flask test client for `seconds`, in this process.
+    The app must already point at the seeded database.
+    """
+    import server
+
+    client = server.app.test_client()
+    next_request = RequestFactory(entries, users, posts)
+    # warm up the connection pool, the page cache and the lazy indexes
+    for _ in range(20):
+        method, path, body = next_request()
+        client.open(path, method=method, json=body)
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, path, body = next_request()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        errors += response.status_code >= 500
+    return summarize(latencies, errors, seconds, _peak_rss_mb_self())
+
+
+def run_server(entries, users, posts, seconds, port, connections):
+    """Replay over HTTP against a running server with `connections`
+    keep-alive connections, each driven by its own thread.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def run(seed):
+        next_request = RequestFactory(entries, users, posts, seed)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine = []
+        while time.perf_counter() < deadline:
+            method, path, body = next_request()
+            headers = {}
+            if body is not None:
+                body = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            mine.append(time.perf_counter() - start)
+            if response.status >= 500:
+                with lock:
+                    errors[0] += 1
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run, args=(seed,)) for seed in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def _routes(entries):
+    """Route name -> the templates replayed for it."""
+    routes = {route_name(entry): [entry] for entry in entries}
+    routes[MIX_ROUTE] = entries
+    return routes
+
+
+def replay(mix, target="client", users=10_000, posts=2_000, seconds=3,
+           workers=1, threads=8, connections=8):
+    """Seed a scratch database and measure every route of the mix file.
+    Returns {route: summary}.
+    """
+    entries = load_mix(mix)
+    path, database_url = seeded_database(users, posts)
+    results = {}
+    try:
+        for route, route_entries in _routes(entries).items():
+            # every route starts from the same data
+            route_path = f"{path}.route"
+            _copy_database(path, route_path)
+            route_url = f"sqlite:///{route_path}"
+            try:
+                if target == "client":
+                    results[route] = _client_subprocess(
+                        route_entries, route_url, users, posts, seconds
+                    )
+                else:
+                    port = free_port()
+                    server = start_server(route_url, port, workers, threads)
+                    try:
+                        latencies, errors = run_server(
+                            route_entries, users, posts, seconds, port, connections
+                        )
+                        peak = _peak_rss_mb_children(server.pid)
+                    finally:
+                        stop_server(server)
+                    results[route] = summarize(latencies, errors, seconds, peak)
+            finally:
+                _remove_database(route_path)
+    finally:
+        _remove_database(path)
+    return results
+
+
+def _copy_database(source, destination):
+    import sqlite3
+
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(destination)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def _remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _client_subprocess(entries, database_url, users, posts, seconds):
+    """Run one route through the test client in a fresh interpreter, so
+    the peak RSS it reports belongs to that route alone.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.replay", "--run-client",
+         json.dumps({"entries": entries, "users": users, "posts": posts,
+                     "seconds": seconds})],
+        env=dict(os.environ, DATABASE_URL=database_url),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE, check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def print_results(results, title=None):
+    if title:
+        print(title)
+    print(
+        f"{'route':<58}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'RSS MB':>8}{'errors':>7}"
+    )
+    for route, stats in results.items():
+        cells = [
+            f"{stats[key]:>9.2f}" if stats[key] is not None else f"{'-':>9}"
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+        ]
+        rss = stats["peak_rss_mb"]
+        print(
+            f"{route[:57]:<58}{stats['requests_per_s']:>9.0f}{''.join(cells)}"
+            f"{rss if rss is not None else float('nan'):>8.1f}{stats['errors']:>7}"
+        )
+
+
+def add_arguments(parser):
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="JSONL request mix")
+    parser.add_argument("--target", choices=["client", "server"], default="client")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=2_000)
+    parser.add_argument("--seconds", type=float, default=3, help="per route")
+    parser.add_argument("--workers", type=int, default=1, help="server target only")
+    parser.add_argument("--threads", type=int, default=8, help="server target only")
+    parser.add_argument("--connections", type=int, default=8, help="server target only")
+
+
+def replay_from_args(args):
+    return replay(
+        args.mix, args.target, args.users, args.posts, args.seconds,
+        args.workers, args.threads, args.connections,
+    )
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--run-client":
+        task = json.loads(sys.argv[2])
+        result = run_client(task["entries"], task["users"], task["posts"], task["seconds"])
+        print(json.dumps(result))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    print_results(
+        replay_from_args(args),
+        f"{args.target}: {args.users:,} users, {args.posts:,} posts, "
+        f"{args.seconds}s per route",
+    )
+
+
+if __name__ == "__main__":
+    main()
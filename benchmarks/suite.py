@@ -0,0 +1,118 @@
+"""Run the microbenchmarks and the endpoint replay together, optionally
+saving the results as a baseline or comparing them against one.
+
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.15]
+
+Comparing prints the change of every metric and exits with status 1 if
+any got worse by more than the threshold (a fraction). Timings are noisy,
+so compare runs made on the same machine with the same options, and
+rerun before trusting a single flagged result.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from benchmarks import micro, replay
+
+# metric -> True if higher is better
+ENDPOINT_METRICS = {
+    "requests_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def collect(args):
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "options": {key: value for key, value in vars(args).items()
+                        if key not in ("save", "compare")},
+        },
+    }
+    if not args.skip_micro:
+        results["micro"] = micro.run_all(args.size, args.repeat, args.only)
+        micro.print_results(results["micro"], f"\n{args.size:,} items, best of {args.repeat}")
+    if not args.skip_endpoints:
+        results["endpoints"] = {args.target: replay.replay_from_args(args)}
+        replay.print_results(
+            results["endpoints"][args.target],
+            f"\n{args.target}: {args.users:,} users, {args.posts:,} posts, "
+            f"{args.seconds}s per route",
+        )
+    return results
+
+
+def _pairs(baseline, current):
+    """Yield (name, old, new, higher_is_better) for every metric present
+    in both result sets.
+    """
+    for name, old in baseline.get("micro", {}).items():
+        new = current.get("micro", {}).get(name)
+        if new is not None:
+            yield name, old, new, False
+    for target, routes in baseline.get("endpoints", {}).items():
+        for route, old_stats in routes.items():
+            new_stats = current.get("endpoints", {}).get(target, {}).get(route)
+            if new_stats is None:
+                continue
+            for metric, higher_is_better in ENDPOINT_METRICS.items():
+                old, new = old_stats.get(metric), new_stats.get(metric)
+                if old and new is not None:
+                    yield f"{target} {route} {metric}", old, new, higher_is_better
+
+
+def compare(baseline, current, threshold):
+    """Print the change of every metric and return the names of those
+    that regressed by more than `threshold`.
+    """
+    regressions = []
+    print(f"\n{'metric':<80}{'baseline':>11}{'current':>11}{'change':>9}")
+    for name, old, new, higher_is_better in _pairs(baseline, current):
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name[:79]:<80}{old:>11.2f}{new:>11.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    micro.add_arguments(parser)
+    replay.add_arguments(parser)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="baseline to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.15,
+        help="relative change counted as a regression (default 0.15)",
+    )
+    args = parser.parse_args()
+
+    results = collect(args)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nbaseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nno regressions above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""Read-through cache for the API's GET endpoints"""
+import collections
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+from serializers import Encoded
+from single_flight import SingleFlight
+
+# Returned by backends on a miss, since None is a value worth caching too
+# (a lookup that found nothing)
+MISSING = object()
+
+
+class CacheStats:
+    """Counters shared by every backend. Kept per process."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def to_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class CacheBackend:
+    """Interface of a cache backend. Values are stored with a time to live
+    in seconds. Counters live apart from the cached values and are never
+    evicted, since `Cache` uses them as generation numbers.
+    """
+
+    name = None
+
+    # True when every worker process sees the same entries
+    shared = False
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        """Return the value stored under `key`, or MISSING."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Delete every entry whose key starts with `prefix`."""
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Increment the counter `key` (starting from 0) and return it."""
+        raise NotImplementedError
+
+    def counter(self, key):
+        """Current value of the counter `key`, 0 if it was never incremented."""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """Backend that stores nothing, for turning caching off."""
+
+    name = "none"
+    shared = True
+
+    def get(self, key):
+        self.stats.misses += 1
+        return MISSING
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def delete_prefix(self, prefix):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def counter(self, key):
+        return 0
+
+    def __len__(self):
+        return 0
+
+    def clear(self):
+        pass
+
+
+class LocalCache(CacheBackend):
+    """In-process LRU cache bounded to `max_entries`. An OrderedDict keeps
+    entries in recency order: hits move an entry to the end and inserts
+    evict from the front. Expired entries are dropped when they are read.
+    """
+
+    name = "local"
+
+    def __init__(self, max_entries=10_000):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def check_private_path(path):
+    """Raise ValueError unless only the current user can write the file
+    `path` and the directory holding it, so no other local user can plant
+    or replace cached responses. Not checked where there are no Unix
+    file owners (Windows).
+    """
+    if not hasattr(os, "getuid"):
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    for name in [directory] + [path] * os.path.exists(path):
+        info = os.stat(name)
+        if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise ValueError(
+                f"CACHE_PATH {path!r} is not private: {name!r} must be owned "
+                "by this user and not writable by others"
+            )
+
+
+class SQLiteCache(CacheBackend):
+    """Cache in a SQLite file that several worker processes on one machine
+    can share, standing in for a shared cache server such as memcached or
+    Redis: every process sees the same entries and invalidations.
+
+    Only encoded documents (`serializers.Encoded`) and None are stored,
+    as plain columns, so reading the file never runs code from it. The
+    file must still be private to the user running the app (see
+    `check_private_path`), since whoever can write it chooses what the API
+    serves. Recency is tracked approximately (at most one access-time
+    update per entry per second) so that hits rarely write, and the size
+    bound is enforced every `EVICTION_CHECK_INTERVAL` sets.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, path, max_entries=100_000):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        check_private_path(path)
+        # created private, before SQLite creates it with the umask's mode
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        connection = self._connection()
+        with connection:
+            # entries of older versions held pickles, which are never read
+            connection.execute("DROP TABLE IF EXISTS cache")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, body BLOB, etag TEXT, cursor INTEGER, "
+                "expires_at REAL, accessed_at REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_entries_accessed_at "
+                "ON entries (accessed_at)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters "
+                "(key TEXT PRIMARY KEY, value INTEGER)"
+            )
+
+    def _connection(self):
+        """One connection per thread, since sqlite3 connections must not be
+        shared between threads.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT body, etag, cursor, expires_at, accessed_at FROM entries WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return MISSING
+        # wall clock, since the file is shared between processes
+        now = time.time()
+        body, etag, cursor, expires_at, accessed_at = row
+        if expires_at <= now:
+            with connection:
+                connection.execute(
+                    "DELETE FROM entries WHERE key = ? AND expires_at <= ?",
+                    (key, now)
+                )
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return MISSING
+        if now - accessed_at > 1:
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+        self.stats.hits += 1
+        # a NULL body stands for None
+        return Encoded(body, etag, cursor) if body is not None else None
+
+    def set(self, key, value, ttl):
+        if value is None:
+            value = Encoded(None, None)
+        elif not isinstance(value, Encoded):
+            raise TypeError(f"cannot cache {type(value).__name__} in SQLite, only Encoded or None")
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value.body, value.etag, value.cursor, now + ttl, now)
+            )
+        self._sets += 1
+        if self._sets % self.EVICTION_CHECK_INTERVAL == 0:
+            self._evict()
+
+    def _evict(self):
+        connection = self._connection()
+        with connection:
+            excess = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            excess -= self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+                self.stats.evictions += excess
+
+    def delete(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix):
+        connection = self._connection()
+        with connection:
+            # a range on the primary key rather than LIKE, which it cannot use
+            connection.execute(
+                "DELETE FROM entries WHERE key >= ? AND key < ?",
+                (prefix, prefix + "\U0010ffff")
+            )
+
+    def incr(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO counters VALUES (?, 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1",
+                (key,)
+            )
+            return connection.execute(
+                "SELECT value FROM counters WHERE key = ?", (key,)
+            ).fetchone()[0]
+
+    def counter(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM entries")
+
+
+class Cache:
+    """Read-through cache on top of a backend.
+
+    Single entities are cached under their own key (`user:5`) and deleted
+    by the write endpoints. Pages of list endpoints are keyed by a
+    generation number per namespace (`users:<generation>:...`): a write
+    bumps the generation, so every page cached before it is skipped at
+    once and ages out of the LRU.
+
+    A read that races with a write can still store a value read just
+    before the write committed; the TTL bounds how long that can last.
+
+    Loads go through a `SingleFlight`, so concurrent misses on the same
+    key (many requests for a post that just expired) share one load. This
+    holds with the "none" backend too.
+    """
+
+    def __init__(self, backend, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.flights = SingleFlight()
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` and caching
+        its result on a miss.
+        """
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = self.flights.do(key, lambda: self._load(key, loader, ttl))
+        return value
+
+    def get_or_set_many(self, keys, loader, ttl=None):
+        """{key: value} for `keys`, with a single `loader(missing_keys)`
+        call for the keys that are not cached. The loader returns
+        {key: value}; keys it leaves out are cached as None.
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.backend.get(key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            values.update(self.flights.do_many(
+                missing, lambda keys: self._load_many(keys, loader, ttl)
+            ))
+        return values
+
+    def _load(self, key, loader, ttl):
+        value = loader()
+        self.backend.set(key, value, ttl if ttl is not None else self.ttl)
+        return value
+
+    def _load_many(self, keys, loader, ttl):
+        loaded = loader(keys)
+        values = {key: loaded.get(key) for key in keys}
+        for key, value in values.items():
+            self.backend.set(key, value, ttl if ttl is not None else self.ttl)
+        return values
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.backend.delete(key)
+
+    def invalidate_prefix(self, prefix):
+        """Drop every entity cached under a key starting with `prefix`."""
+        self.backend.delete_prefix(prefix)
+
+    def page_key(self, namespace, *parts):
+        """Key for one page of a list in `namespace`, at its current
+        generation.
+        """
+        generation = self.backend.counter(f"generation:{namespace}")
+        return ":".join([namespace, str(generation), *map(str, parts)])
+
+    def invalidate_pages(self, namespace):
+        self.backend.incr(f"generation:{namespace}")
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            **self.backend.stats.to_dict(),
+            "loads": self.flights.loads,
+            "shared_loads": self.flights.shared,
+        }
+
+
+def from_config(config):
+    """Build the cache described by the app config:
+
+    CACHE_BACKEND      "local" (default), "sqlite" or "none"
+    CACHE_TTL          seconds an entry stays valid (default 60)
+    CACHE_MAX_ENTRIES  LRU size bound (default 10000)
+    CACHE_PATH         file of the sqlite backend, required with it, in a
+                       directory only the user running the app can write to
+    """
+    kind = config.get("CACHE_BACKEND", "local")
+    max_entries = int(config.get("CACHE_MAX_ENTRIES", 10_000))
+    if kind == "local":
+        backend = LocalCache(max_entries)
+    elif kind == "sqlite":
+        path = config.get("CACHE_PATH")
+        if not path:
+            raise ValueError("CACHE_BACKEND=sqlite needs CACHE_PATH")
+        backend = SQLiteCache(path, max_entries)
+    elif kind == "none":
+        backend = NullCache()
+    else:
+        raise ValueError(f"unknown CACHE_BACKEND {kind!r}")
+    return Cache(backend, ttl=float(config.get("CACHE_TTL", 60)))
@@ -0,0 +1,53 @@
+"""Background purge of soft-deleted rows"""
+import threading
+import time
+import traceback
+
+
+class Compactor:
+    """Periodically hard-deletes tombstoned rows in small batches.
+
+    `purge_batch(batch_size)` deletes at most `batch_size` rows in one
+    short transaction and returns how many it deleted. Batches are
+    repeated until one comes back short, with a pause between them so
+    the SQLite write lock is never held for long and request writes can
+    get in between.
+    """
+
+    def __init__(self, purge_batch, interval=60, batch_size=500, pause=0.05):
+        self.purge_batch = purge_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.purged = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Purge every row that is due now, returning how many were purged."""
+        total = 0
+        while not self._stop.is_set():
+            count = self.purge_batch(self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.purged += total
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                # a locked database or similar: try again next interval
+                traceback.print_exc()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
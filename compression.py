@@ -0,0 +1,188 @@
+"""Content-negotiated compression of responses, streamed ones included"""
+import importlib.util
+import zlib
+
+from flask import request
+
+import instrumentation
+
+# zstd and brotli are only offered when their packages are installed, and
+# are imported by the first response that uses them
+zstandard = None
+brotli = None
+_zstandard_installed = importlib.util.find_spec("zstandard") is not None
+_brotli_installed = importlib.util.find_spec("brotli") is not None
+
+# Encodings in order of preference when the client accepts several equally
+ENCODINGS = ("zstd", "br", "gzip", "deflate")
+
+# Media types worth compressing; anything else (gzip and Parquet exports,
+# Arrow streams) is already compressed or binary and is sent as it is
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson"}
+
+
+def available_encodings():
+    installed = {"zstd": _zstandard_installed, "br": _brotli_installed}
+    return [name for name in ENCODINGS if installed.get(name, True)]
+
+
+class _BrotliCompressor:
+    """brotli.Compressor with the compress/flush methods of the others."""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def compressor(encoding, level=6):
+    """A new compressor object for `encoding`, with `compress(data)` and
+    `flush()` methods returning the next bytes of the encoded stream.
+    """
+    global zstandard, brotli
+    if encoding == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        # HTTP's "deflate" is the zlib format, not a raw deflate stream
+        return zlib.compressobj(level)
+    if encoding == "zstd":
+        if zstandard is None:
+            import zstandard
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    if encoding == "br":
+        if brotli is None:
+            import brotli
+        return _BrotliCompressor(level)
+    raise ValueError(f"unknown content encoding {encoding!r}")
+
+
+def compress(encoding, data, level=6):
+    stream = compressor(encoding, level)
+    return stream.compress(data) + stream.flush()
+
+
+def compress_chunks(encoding, chunks, level=6, buffer_size=16 * 1024):
+    """Compress a stream of byte strings as it is produced. Small chunks
+    (a streamed listing yields one per row) are gathered up to
+    `buffer_size` bytes first, as one compressor call per row costs more
+    than the compression itself. Compressed bytes are passed on as soon as
+    the compressor emits them, so neither the body nor its compressed form
+    is ever held in memory. Closing this generator closes `chunks`, which
+    ends the request context of a `stream_with_context` body.
+    """
+    stream = compressor(encoding, level)
+    pending, size = [], 0
+    try:
+        for chunk in chunks:
+            pending.append(chunk)
+            size += len(chunk)
+            if size < buffer_size:
+                continue
+            compressed = stream.compress(b"".join(pending))
+            pending, size = [], 0
+            if compressed:
+                yield compressed
+        yield stream.compress(b"".join(pending)) + stream.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class Compression:
+    """Compresses the responses of an app with the best encoding the
+    client's Accept-Encoding allows.
+
+    Bodies shorter than `min_size` bytes are sent as they are, since the
+    headers and CPU time would cost more than the bytes saved. Streamed
+    bodies, whose size is not known up front, are always compressed, a
+    chunk at a time, and go out with chunked transfer encoding. The ETag
+    of a compressed response is made weak, as its bytes are not those the
+    tag was computed from; conditional requests still match it. A 304
+    gets the same Vary header and weak ETag as the response it stands for,
+    unless the client holds the uncompressed copy under its strong tag.
+    """
+
+    def __init__(self, min_size=1024, level=6, encodings=None):
+        self.min_size = min_size
+        self.level = level
+        self.encodings = list(encodings or available_encodings())
+
+    def init_app(self, app):
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def _compressible_type(response):
+        mimetype = response.mimetype or ""
+        return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+    def _compressible(self, response):
+        return (
+            200 <= response.status_code < 300
+            and response.status_code not in (204, 206)
+            and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers
+            and self._compressible_type(response)
+        )
+
+    def _not_modified(self, response):
+        if not self._compressible_type(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        etag, weak = response.get_etag()
+        if (
+            etag is not None and not weak
+            and not request.if_none_match.contains(etag)
+            and request.accept_encodings.best_match(self.encodings) is not None
+        ):
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _after_request(self, response):
+        if response.status_code == 304:
+            return self._not_modified(response)
+        if not self._compressible(response):
+            return response
+        if not response.is_streamed and response.calculate_content_length() < self.min_size:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_chunks(encoding, response.response, self.level)
+            response.headers.pop("Content-Length", None)
+        else:
+            with instrumentation.phase("compress"):
+                response.set_data(compress(encoding, response.get_data(), self.level))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def enabled(config):
+    return str(config.get("COMPRESSION", "1")).lower() not in ("0", "false", "no", "off")
+
+
+def from_config(config):
+    """Build the response compression described by the app config, or
+    None if it is disabled:
+
+    COMPRESSION           "0" to turn it off (on by default)
+    COMPRESSION_MIN_SIZE  smaller bodies are not compressed (1024 bytes)
+    COMPRESSION_LEVEL     1 (fastest) to 9 (smallest), for every encoding (6)
+    """
+    if not enabled(config):
+        return None
+    return Compression(
+        min_size=int(config.get("COMPRESSION_MIN_SIZE", 1024)),
+        level=int(config.get("COMPRESSION_LEVEL", 6)),
+    )
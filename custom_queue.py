@@ -1,38 +1,109 @@
+import collections
+
+
 class Node:
+    __slots__ = ("data", "next_")
+
     def __init__(self, data=None, next_=None):
         """A queue is a special type of linked list."""
         self.data = data
         self.next_ = next_
 
+
 class Queue:
-    def __init__(self):
-        """Specify the head/start and tail/end of the queue."""
-        self.head = None
-        self.tail = None
+    """First in first out queue of items.
 
-    def enqueue(self, data):
-        """Add data to the tail of the queue. If both tail and head
-        are empty set new Node to head and tail. Otherwise, set the pointer
-        of tail to the new Node and the tail itself to be the new Node.
+    The items are kept in a `collections.deque`, a ring of fixed-size
+    blocks, instead of one `Node` per item: about 8 bytes per item rather
+    than a whole object, with O(1) operations at both ends.
+
+    With `index_key` set (e.g. "id"), a dict from `item[index_key]` to the
+    item is maintained too, so `get` finds a queued item without a scan.
+    When several queued items share a key, `get` returns the oldest, and
+    dequeuing it scans the queue for the next one.
+    """
+
+    __slots__ = ("_items", "index_key", "_index", "_duplicates")
+
+    def __init__(self, iterable=None, index_key=None):
+        self._items = collections.deque()
+        self.index_key = index_key
+        # key -> oldest queued item with that key
+        self._index = {} if index_key is not None else None
+        # key -> number of queued items with that key, only when above one
+        self._duplicates = {}
+        if iterable is not None:
+            self.extend(iterable)
+
+    @classmethod
+    def from_iterable(cls, iterable, index_key=None):
+        """Build a queue holding the items of `iterable`, first one first."""
+        return cls(iterable, index_key)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        """Iterate over the queued items from the oldest to the newest,
+        without removing them.
         """
-        if self.tail is None and self.head is None:
-            self.tail = self.head = Node(data, None)
-            return
+        return iter(self._items)
+
+    def __repr__(self):
+        return f"Queue({list(self._items)!r})"
 
-        self.tail.next_ = Node(data, None)
-        self.tail = self.tail.next_
-        return
+    def _add_to_index(self, data):
+        key = data[self.index_key]
+        if key in self._index:
+            self._duplicates[key] = self._duplicates.get(key, 1) + 1
+        else:
+            self._index[key] = data
+
+    def enqueue(self, data):
+        """Add data to the tail of the queue."""
+        self._items.append(data)
+        if self._index is not None:
+            self._add_to_index(data)
+
+    def extend(self, iterable):
+        """Add every item of `iterable` to the tail of the queue, in order."""
+        if self._index is None:
+            self._items.extend(iterable)
+            return
+        for data in iterable:
+            self._items.append(data)
+            self._add_to_index(data)
 
     def dequeue(self):
-        """Remove the data from the head of the tail, following the 
-        first in first out (FIFO) principle or first come first served.
+        """Remove and return the data at the head of the queue, following
+        the first in first out (FIFO) principle or first come first served.
+        Returns None if the queue is empty.
         """
-        if self.head is None:
+        if not self._items:
             return None
-        removed = self.head
-        self.head = self.head.next_
-        
-        if self.head is None:
-            self.tail = None
+        data = self._items.popleft()
+        if self._index is not None:
+            key = data[self.index_key]
+            count = self._duplicates.pop(key, 1)
+            if count == 1:
+                del self._index[key]
+            else:
+                if count > 2:
+                    self._duplicates[key] = count - 1
+                # the next queued item with this key is now the oldest
+                self._index[key] = next(
+                    item for item in self._items if item[self.index_key] == key
+                )
+        return data
 
-        return removed
+    def peek(self):
+        """The data at the head of the queue without removing it, or None."""
+        return self._items[0] if self._items else None
+
+    def get(self, key):
+        """The queued item whose `index_key` field is `key`, or None.
+        Needs `index_key`.
+        """
+        if self._index is None:
+            raise TypeError("get() needs a Queue created with index_key")
+        return self._index.get(key)
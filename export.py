@@ -0,0 +1,191 @@
+"""Bulk export of tables as compressed files, written chunk by chunk"""
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+import zlib
+
+import serializers
+
+# Parquet and Arrow exports are only offered with pyarrow, which is
+# imported by the first such export rather than with the app
+pyarrow = None
+_pyarrow_installed = importlib.util.find_spec("pyarrow") is not None
+
+# format -> (file extension, media type)
+FORMATS = {
+    "csv": (".csv.gz", "application/gzip"),
+    "ndjson": (".ndjson.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrows", "application/vnd.apache.arrow.stream"),
+}
+
+# Formats that need pyarrow
+ARROW_FORMATS = ("parquet", "arrow")
+
+
+def available_formats():
+    return [name for name in FORMATS if _pyarrow_installed or name not in ARROW_FORMATS]
+
+
+def _load_pyarrow():
+    """The pyarrow module, imported on first use, or None if not installed."""
+    global pyarrow
+    if pyarrow is None and _pyarrow_installed:
+        import pyarrow.ipc  # binds the global `pyarrow`
+        import pyarrow.parquet
+    return pyarrow
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte strings into one gzip stream, a chunk at a
+    time, so nothing but the current chunk is held in memory.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def csv_chunks(columns, partitions):
+    """CSV with a header line, one chunk of bytes per partition of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(columns, partitions):
+    """One JSON object per line, one chunk of bytes per partition of rows."""
+    for rows in partitions:
+        yield b"".join(
+            serializers.dumps(dict(zip(columns, row))) + b"\n" for row in rows
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object collecting what pyarrow writes, so it can be
+    passed on as soon as each batch is written.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_chunks(columns, partitions, open_writer):
+    sink = _ChunkSink()
+    writer = None
+    for rows in partitions:
+        table = pyarrow.table(
+            {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+        )
+        if writer is None:
+            writer = open_writer(sink, table.schema)
+        writer.write_table(table)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+def parquet_chunks(columns, partitions):
+    """Parquet file with one row group per partition, zstd compressed."""
+    return _arrow_chunks(
+        columns, partitions,
+        lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd"),
+    )
+
+
+def arrow_chunks(columns, partitions):
+    """Arrow IPC stream with one record batch per partition."""
+    return _arrow_chunks(
+        columns, partitions,
+        lambda sink, schema: pyarrow.ipc.new_stream(sink, schema),
+    )
+
+
+def encode(format_, columns, partitions, level=6):
+    """Byte chunks of `partitions` (lists of row tuples) in `format_`. CSV
+    and NDJSON are gzip compressed; Parquet compresses its own pages.
+    """
+    if format_ in ARROW_FORMATS and _load_pyarrow() is None:
+        raise ValueError(f"{format_} export needs pyarrow, which is not installed")
+    if format_ == "csv":
+        return gzip_chunks(csv_chunks(columns, partitions), level)
+    if format_ == "ndjson":
+        return gzip_chunks(ndjson_chunks(columns, partitions), level)
+    if format_ == "parquet":
+        return parquet_chunks(columns, partitions)
+    if format_ == "arrow":
+        return arrow_chunks(columns, partitions)
+    raise ValueError(f"unknown export format {format_!r}")
+
+
+class SnapshotStore:
+    """Directory of complete exports, named after the state of the data
+    they hold, so an unchanged table is exported once and then served
+    from disk. The directory is created private to the user running the
+    app, and should not be shared between databases.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Path of the snapshot `name`, or None if it was never written."""
+        path = self.path(name)
+        return path if os.path.exists(path) else None
+
+    def tee(self, name, chunks, replaces=None):
+        """Yield `chunks` while writing them to the snapshot `name`. The
+        file only appears once the last chunk is written, so a client that
+        disconnects halfway leaves no partial snapshot behind. Older
+        snapshots whose names start with `replaces` are then deleted.
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            os.replace(temp_path, self.path(name))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if replaces:
+            for old in os.listdir(self.directory):
+                if old.startswith(replaces) and old != name:
+                    try:
+                        os.remove(self.path(old))
+                    except FileNotFoundError:
+                        pass
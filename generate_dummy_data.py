@@ -1,54 +1,248 @@
-"""Generates dummy data for SQLite database"""
-from random import randrange
-from sqlite3 import Connection as SQLite3Connection
-from datetime import datetime
-from faker import Faker
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-import server
-
-# app
-app = Flask(__name__)
-
-# config
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///sqlitedb.file"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = 0
-
-# configure sqlite3 to enforce foreign key contraints
-@event.listens_for(Engine, "connect")
-def _set_sqlite_pragma(dbapi_connection, connection_record):
-    if isinstance(dbapi_connection, SQLite3Connection):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON;")
-        cursor.close()
-
-
-db = SQLAlchemy(app)
-now = datetime.now()
-
-faker = Faker()
-
-# create dummy users
-for i in range(200):
-    name = faker.name()
-    address = faker.address()
-    phone = faker.msisdn()
-    email = f'{name.replace(" ", "_")}@email.com'
-    new_user = server.User(name=name, address=address, phone=phone, email=email)
-    db.session.add(new_user)
-    db.session.commit()
-
-# create dummy blog posts
-for i in range(200):
-    title = faker.sentence(5)
-    body = faker.paragraph(190)
-    date = faker.date_time()
-    user_id = randrange(1, 200)
-
-    new_blog_post = server.BlogPost(
-        title=title, body=body, date=date, user_id=user_id
+"""Generates dummy data for SQLite database
+
+Rows are built with Faker, optionally in several worker processes, and
+written by this process alone in large bulk-insert transactions:
+
+    python generate_dummy_data.py --users 1000000 --posts 5000000 \\
+        --batch-size 20000 --processes 8 --seed 42
+
+The search index and change log triggers are dropped during the load
+and the new posts indexed at the end (see `server.bulk_load`), so run it
+while the app is stopped or idle.
+
+Set `DATABASE_URL` to load a database other than the app's default one.
+With `SHARDS` set, ids come from the app's id allocator and each user and
+their posts go to their own shard, as if created through the API.
+"""
+import argparse
+import contextlib
+import functools
+import multiprocessing
+import random
+import time
+
+
+def _faker(seed):
+    """A Faker seeded with `seed`. Faker is imported on first use by the
+    processes that build rows, rather than on import: it takes a large
+    part of a second, which `--help` and, with `--processes`, the writer
+    process do not need to pay.
+    """
+    from faker import Faker
+
+    faker = Faker()
+    faker.seed_instance(seed)
+    return faker
+
+
+def _users(task):
+    """Build one batch of user rows. Runs in a worker process, so it only
+    gets plain arguments and returns plain dicts.
+    """
+    seed, count = task
+    faker = _faker(seed)
+    rows = []
+    for _ in range(count):
+        name = faker.name()
+        rows.append({
+            "name": name,
+            "address": faker.address(),
+            "phone": faker.msisdn(),
+            "email": f'{name.replace(" ", "_")}@email.com',
+        })
+    return rows
+
+
+# Faker sentences already built by this process, keyed by (seed, size)
+_sentence_pools = {}
+
+
+def _sentence_pool(seed, size):
+    """Faker spends most of its time building sentences, so large loads
+    build a pool of them once per process and assemble bodies from it.
+    """
+    key = (seed, size)
+    if key not in _sentence_pools:
+        _sentence_pools[key] = _faker(seed).sentences(size)
+    return _sentence_pools[key]
+
+
+def _blog_posts(task):
+    """Build one batch of blog post rows, without their `user_id`, which
+    the writer assigns. Bodies are 190 sentences, either fresh from Faker
+    or drawn from a shared sentence pool when `pool_size` is set.
+    """
+    seed, count, pool_seed, pool_size = task
+    faker = _faker(seed)
+    if not pool_size:
+        return [
+            {
+                "title": faker.sentence(5),
+                "body": faker.paragraph(190),
+                "date": faker.date_time(),
+            }
+            for _ in range(count)
+        ]
+
+    pool = _sentence_pool(pool_seed, pool_size)
+    rng = random.Random(seed)
+    return [
+        {
+            "title": faker.sentence(5),
+            "body": " ".join(rng.choices(pool, k=190)),
+            "date": faker.date_time(),
+        }
+        for _ in range(count)
+    ]
+
+
+def _tasks(total, batch_size, seed):
+    """Split `total` rows into batches, each with its own derived seed so the
+    output does not depend on how many processes generate it.
+    """
+    return [
+        (seed + i, min(batch_size, total - start))
+        for i, start in enumerate(range(0, total, batch_size))
+    ]
+
+
+def _generate(build, tasks, pool):
+    if pool is None:
+        return map(build, tasks)
+    return pool.imap(build, tasks)
+
+
+def _load(connections, table, batches, total, shard_of, prepare=None):
+    """Insert each batch with one executemany INSERT per shard it touches
+    and commit it as its own transaction, reporting progress as it goes.
+    `shard_of(row)` is the shard of a row, and `connections` has one
+    connection per shard.
+    """
+    start = time.perf_counter()
+    done = 0
+    for rows in batches:
+        if prepare is not None:
+            prepare(rows)
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_of(row), []).append(row)
+        for shard, shard_rows in by_shard.items():
+            connections[shard].execute(table.insert(), shard_rows)
+            connections[shard].commit()
+        done += len(rows)
+        elapsed = time.perf_counter() - start
+        print(
+            f"\r{table.name}: {done:,}/{total:,} rows "
+            f"({done / elapsed:,.0f} rows/s)",
+            end="", flush=True,
+        )
+    if total:
+        print()
+
+
+def _user_ids(connections, shard_of, user_table):
+    """Ids of the users on every shard, or None if one of them is not on
+    its own shard, as happens when SHARDS was raised without resharding.
+    """
+    user_ids = []
+    for shard, connection in enumerate(connections):
+        ids = connection.execute(user_table.select().with_only_columns(user_table.c.id))
+        ids = ids.scalars().all()
+        connection.commit()
+        if any(shard_of(user_id) != shard for user_id in ids):
+            return None
+        user_ids += ids
+    user_ids.sort()
+    return user_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with fake users and blog posts.")
+    parser.add_argument("--users", type=int, default=200, help="users to create")
+    parser.add_argument("--posts", type=int, default=200, help="blog posts to create")
+    parser.add_argument(
+        "--batch-size", type=int, default=10_000,
+        help="rows generated per task and inserted per transaction",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data")
+    parser.add_argument(
+        "--sentence-pool", type=int, default=10_000,
+        help="build post bodies from this many pre-generated Faker sentences, "
+             "which is much faster; 0 generates every body from scratch",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="worker processes generating rows with Faker (default: 1, no pool)",
     )
-    db.session.add(new_blog_post)
-    db.session.commit()
\ No newline at end of file
+    args = parser.parse_args(argv)
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    rng = random.Random(seed)
+
+    # imported here so worker processes do not import the app
+    import server
+
+    app = server.create_app()
+    with app.app_context():
+        server.init_db()
+
+    pool = multiprocessing.Pool(args.processes) if args.processes > 1 else None
+    try:
+        with app.app_context(), contextlib.ExitStack() as stack:
+            stack.enter_context(server.bulk_load())
+            connections = [
+                stack.enter_context(server._engine(shard).connect())
+                for shard in server._shards()
+            ]
+            for connection in connections:
+                # the data can simply be regenerated if the machine crashes mid-load
+                connection.exec_driver_sql("PRAGMA synchronous=OFF")
+            allocator = app.extensions["api"].id_allocator
+            if _user_ids(connections, server._shard_of, server.User.__table__) is None:
+                parser.error(
+                    "some users are not on their shard: run `flask --app server "
+                    "reshard --from <old number of shards>` first"
+                )
+
+            def assign_ids(name, rows):
+                # unsharded, SQLite numbers the rows itself
+                if allocator is not None:
+                    for row, row_id in zip(rows, allocator.allocate(name, len(rows))):
+                        row["id"] = row_id
+
+            user_batches = _generate(
+                _users, _tasks(args.users, args.batch_size, seed), pool
+            )
+            _load(
+                connections, server.User.__table__, user_batches, args.users,
+                shard_of=lambda row: server._shard_of(row.get("id", 0)),
+                prepare=functools.partial(assign_ids, "user"),
+            )
+
+            user_ids = _user_ids(connections, server._shard_of, server.User.__table__)
+            if args.posts and not user_ids:
+                parser.error("cannot create blog posts without any users")
+
+            def assign_users(rows):
+                for row in rows:
+                    row["user_id"] = rng.choice(user_ids)
+                assign_ids("blog_post", rows)
+
+            post_tasks = [
+                (task_seed, count, seed, args.sentence_pool)
+                for task_seed, count in _tasks(args.posts, args.batch_size, seed + 1_000_003)
+            ]
+            post_batches = _generate(_blog_posts, post_tasks, pool)
+            _load(
+                connections, server.BlogPost.__table__, post_batches, args.posts,
+                shard_of=lambda row: server._shard_of(row["user_id"]),
+                prepare=assign_users,
+            )
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+if __name__ == "__main__":
+    main()
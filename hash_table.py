@@ -1,94 +1,184 @@
 """File for hash table data structure"""
+from collections.abc import MutableMapping
 
+# Marks a slot whose entry was deleted. Lookups must probe past it, while
+# inserts may reuse it.
+_DELETED = object()
+
+# Smallest number of slots, always a power of two
+_MIN_SIZE = 8
+
+_HASH_MASK = (1 << 64) - 1
 
-class Node:
-    def __init__(self, data=None, next_=None):
-        """Convenient to use a linked list node data structure to take
-        care of hash collisions, i.e. when two different keys get mapped
-        to the same hash value.
-        """
-        self.data = data
-        self.next_ = next_
 
+class Entry:
+    """Key-value pair stored directly in a slot of the table. Keys MUST be
+    unique, but values need not be. The key's hash is cached so that
+    resizing and probing never have to call `hash` again. `__slots__`
+    keeps each entry to three pointers instead of a per-instance dict.
+    """
 
-class Data:
-    def __init__(self, key, value):
-        """Key-value pair. Keys MUST be unique, but values need not be."""
+    __slots__ = ("key", "value", "hash")
+
+    def __init__(self, key, value, hash_):
         self.key = key
         self.value = value
+        self.hash = hash_
+
+
+# Older code refers to the key-value pair as `Data`
+Data = Entry
 
 
-class HashTable:
-    def __init__(self, table_size):
-        """"""
-        self.table_size = table_size
-        self.hash_table = [None] * table_size
+class HashTable(MutableMapping):
+    """Hash table using open addressing: entries live directly in one flat
+    array of slots instead of linked lists hanging off each bucket.
+
+    Collisions are resolved with the same perturbed probe sequence CPython's
+    dict uses, so every bit of the hash eventually influences the slot and
+    clustered keys spread out quickly. The table grows once two thirds of
+    the slots are in use (counting deleted ones) and shrinks when it falls
+    below one eighth full, so chains stay short at any size.
+
+    Besides the old `add_key_value`/`get_value` API it supports the full
+    mapping protocol: `t[key]`, `t[key] = value`, `del t[key]`, `in`,
+    `len`, iteration, `get`, `pop`, `items` and so on.
+    """
+
+    def __init__(self, table_size=_MIN_SIZE):
+        """Allocate room for at least `table_size` slots, rounded up to a
+        power of two so a slot index is just `hash & (size - 1)`.
+        """
+        size = _MIN_SIZE
+        while size < table_size:
+            size *= 2
+        self.hash_table = [None] * size
+        self._used = 0  # live entries
+        self._filled = 0  # live entries plus deleted markers
+
+    @property
+    def table_size(self):
+        return len(self.hash_table)
 
     def hash_function(self, key):
-        """Custom hash function to map a key into an index for O(1) operations.
-        Use the modulo operator `%` to ensure that hash_value stays within
-        the boundary of the hash table size. The `ord` function maps a single 
-        character string into its corresponding ASCII integer. Opposite is `chr`.
-        A good hash function will not have a lot of hash collisions.
+        """Map a key to its first slot. Python's `hash` is well distributed
+        for strings (SipHash) and the probe sequence takes care of keys like
+        small integers whose hashes are sequential.
         """
-        hash_value = 0
-        for i in key:
-            hash_value += ord(i)
-            hash_value = (hash_value * ord(i)) % self.table_size
-        return hash_value
+        return hash(key) & (len(self.hash_table) - 1)
 
-    def add_key_value(self, key, value):
-        """Add key-value data and map the key into an index using the 
-        hash function. If the index is not None, then traverse the linked
-        list and add the data node.
+    def _find(self, key, hash_):
+        """Probe for `key`. Return `(index, entry)` if it is present,
+        otherwise `(index, None)` with the slot where it should be inserted.
         """
-        hashed_key = self.hash_function(key)
-        if self.hash_table[hashed_key] is None:
-            self.hash_table[hashed_key] = Node(Data(key, value), None)
-        else:
-            node = self.hash_table[hashed_key]
-            while node.next_:
-                node = node.next_
+        slots = self.hash_table
+        mask = len(slots) - 1
+        perturb = hash_ & _HASH_MASK
+        index = hash_ & mask
+        free = -1
+        while True:
+            entry = slots[index]
+            if entry is None:
+                return (index if free < 0 else free), None
+            if entry is _DELETED:
+                if free < 0:
+                    free = index
+            elif entry.hash == hash_ and (entry.key is key or entry.key == key):
+                return index, entry
+            perturb >>= 5
+            index = (5 * index + 1 + perturb) & mask
 
-            node.next_ = Node(Data(key, value), None)
+    def _resize(self, minimum_used):
+        """Rebuild the table with room for `minimum_used` live entries at
+        under 50% load, dropping all deleted markers.
+        """
+        size = _MIN_SIZE
+        while size <= minimum_used * 2:
+            size *= 2
+        old_slots = self.hash_table
+        slots = self.hash_table = [None] * size
+        mask = size - 1
+        for entry in old_slots:
+            if entry is None or entry is _DELETED:
+                continue
+            perturb = entry.hash & _HASH_MASK
+            index = entry.hash & mask
+            while slots[index] is not None:
+                perturb >>= 5
+                index = (5 * index + 1 + perturb) & mask
+            slots[index] = entry
+        self._filled = self._used
+
+    def __setitem__(self, key, value):
+        hash_ = hash(key)
+        index, entry = self._find(key, hash_)
+        if entry is not None:
+            entry.value = value
+            return
+        if self.hash_table[index] is None:
+            self._filled += 1
+        self.hash_table[index] = Entry(key, value, hash_)
+        self._used += 1
+        if self._filled * 3 >= len(self.hash_table) * 2:
+            self._resize(self._used)
+
+    def __getitem__(self, key):
+        _, entry = self._find(key, hash(key))
+        if entry is None:
+            raise KeyError(key)
+        return entry.value
+
+    def __delitem__(self, key):
+        index, entry = self._find(key, hash(key))
+        if entry is None:
+            raise KeyError(key)
+        self.hash_table[index] = _DELETED
+        self._used -= 1
+        if self._used * 8 < len(self.hash_table) and len(self.hash_table) > _MIN_SIZE:
+            self._resize(self._used)
+
+    def __contains__(self, key):
+        return self._find(key, hash(key))[1] is not None
+
+    def __len__(self):
+        return self._used
+
+    def __iter__(self):
+        used = self._used
+        for entry in self.hash_table:
+            if entry is not None and entry is not _DELETED:
+                yield entry.key
+            if self._used != used:
+                raise RuntimeError("HashTable changed size during iteration")
+
+    def __repr__(self):
+        return f"HashTable({dict(self.items())!r})"
+
+    def clear(self):
+        self.hash_table = [None] * _MIN_SIZE
+        self._used = self._filled = 0
+
+    def add_key_value(self, key, value):
+        """Add key-value data, replacing the value if the key exists."""
+        self[key] = value
 
     def get_value(self, key):
-        """Get the value of a data node using the index, given its key."""
-        hashed_key = self.hash_function(key)
-        if self.hash_table[hashed_key] is not None:
-            node = self.hash_table[hashed_key]
-            if node.next_ is None:
-                return node.data.value
-            while node.next_:
-                if key == node.data.key:
-                    return node.data.value
-                node = node.next_
-
-            if key == node.data.key:
-                return node.data.value
-        return None
+        """Get the value stored under a key, or None if there is none."""
+        _, entry = self._find(key, hash(key))
+        return entry.value if entry is not None else None
+
+    def delete_key(self, key):
+        """Remove a key and return its value, or None if it was missing."""
+        return self.pop(key, None)
 
     def print_table(self):
         """Print the string representation of hash table."""
         print("{")
-        for i, val in enumerate(self.hash_table):
-            if val is not None:
-                ll_string = ""
-                node = val
-                if node.next_:
-                    while node.next_:
-                        ll_string += (
-                            str(node.data.key) + " : " +
-                            str(node.data.value) + " --> "
-                        )
-                        node = node.next_
-                    ll_string += (
-                        str(node.data.key) + " : " +
-                        str(node.data.value) + " --> None"
-                    )
-                    print(f"    [{i}] {ll_string}")
-                else:
-                    print(f"    [{i}] {val.data.key} : {val.data.value}")
+        for i, entry in enumerate(self.hash_table):
+            if entry is _DELETED:
+                print(f"    [{i}] <deleted>")
+            elif entry is not None:
+                print(f"    [{i}] {entry.key} : {entry.value}")
             else:
-                print(f"    [{i}] {val}")
+                print(f"    [{i}] {entry}")
         print("}")
@@ -0,0 +1,301 @@
+"""Opt-in per-request instrumentation: request and SQL timings, rows
+loaded, time spent in named phases, and cProfile dumps of slow requests,
+exposed in the Prometheus text format on `/metrics`.
+
+Everything is off unless the app config sets INSTRUMENTATION; the hooks
+are then not even registered, so there is no cost when it is disabled.
+"""
+import contextlib
+import contextvars
+import cProfile
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds of the request duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Stats of the request being served by the current thread, or None
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """What one request spent its time on."""
+
+    __slots__ = ("start", "sql_seconds", "sql_queries", "rows", "phases", "profiler")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.sql_queries = 0
+        self.rows = 0
+        self.phases = {}
+        self.profiler = None
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Add the time spent in the block to phase `name` of the current
+    request. Outside an instrumented request this does nothing.
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.phases[name] = stats.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class CountingCursor(sqlite3.Cursor):
+    """sqlite3 cursor that adds the rows it returns to the current
+    request's row count.
+    """
+
+    def _count(self, rows):
+        stats = _current.get()
+        if stats is not None:
+            stats.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(super().fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(super().fetchall())
+
+
+class CountingConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors are `CountingCursor`s."""
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_seconds += time.perf_counter() - start
+        stats.sql_queries += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Instrumentation:
+    """Collects the per-request numbers, aggregated per endpoint (the URL
+    rule, so `/user/<int:user_id>` is one series however many users are
+    fetched). Counters are kept per process: with several worker
+    processes each one serves its own `/metrics`.
+
+    A request is profiled when it is sampled (a fraction `profile_rate`
+    of all requests) or when it carries an `X-Profile: 1` header. The
+    profile is written to `profile_dir` only if the request took at least
+    `slow_ms` milliseconds, as a file `pstats` and snakeviz can read.
+    """
+
+    def __init__(self, slow_ms=100, profile_rate=0.0, profile_dir=None):
+        self.slow_ms = slow_ms
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir or os.path.join(
+            tempfile.gettempdir(), "flask_api_profiles"
+        )
+        self._lock = threading.Lock()
+        self._requests = {}  # (endpoint, method, status) -> count
+        self._durations = {}  # endpoint -> [bucket counts..., sum, count]
+        self._sql = {}  # endpoint -> [queries, seconds, rows]
+        self._phases = {}  # (endpoint, phase) -> seconds
+        self._profiles_written = 0
+        self._sources = []
+
+    def init_app(self, app):
+        # shared by every app in the process, so registered only once
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view, methods=["GET"])
+
+    def add_source(self, prefix, collect):
+        """Also export the numbers of the dict returned by `collect()`,
+        each as a metric named `<prefix>_<key>`.
+        """
+        self._sources.append((prefix, collect))
+
+    def _before_request(self):
+        stats = RequestStats()
+        if (request.headers.get("X-Profile") == "1"
+                or (self.profile_rate and random.random() < self.profile_rate)):
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+        _current.set(stats)
+
+    def _after_request(self, response):
+        # Streamed bodies are produced after this point, so only the time
+        # to the first byte of those is counted.
+        stats = _current.get()
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.start
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        if stats.profiler is not None:
+            stats.profiler.disable()
+            if duration * 1000 >= self.slow_ms:
+                self._dump_profile(stats.profiler, endpoint, duration)
+            stats.profiler = None
+        with self._lock:
+            key = (endpoint, request.method, response.status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._durations.setdefault(endpoint, [0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            sql = self._sql.setdefault(endpoint, [0, 0.0, 0])
+            sql[0] += stats.sql_queries
+            sql[1] += stats.sql_seconds
+            sql[2] += stats.rows
+            for name, seconds in stats.phases.items():
+                self._phases[endpoint, name] = self._phases.get((endpoint, name), 0.0) + seconds
+        response.headers["Server-Timing"] = ", ".join(
+            [f"app;dur={duration * 1000:.2f}", f"sql;dur={stats.sql_seconds * 1000:.2f}"]
+            + [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.phases.items()]
+        )
+        return response
+
+    def _teardown_request(self, exception):
+        stats = _current.get()
+        if stats is not None and stats.profiler is not None:
+            stats.profiler.disable()
+        _current.set(None)
+
+    def _dump_profile(self, profiler, endpoint, duration):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = "".join(c if c.isalnum() else "_" for c in f"{request.method}{endpoint}")
+        path = os.path.join(
+            self.profile_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{duration * 1000:.0f}ms_{os.getpid()}.prof"
+        )
+        profiler.dump_stats(path)
+        with self._lock:
+            self._profiles_written += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP flask_http_requests_total Requests served.",
+                "# TYPE flask_http_requests_total counter",
+            ]
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                labels = _labels(endpoint=endpoint, method=method, status=status)
+                lines.append(f"flask_http_requests_total{labels} {count}")
+
+            lines += [
+                "# HELP flask_http_request_duration_seconds Time to handle a request.",
+                "# TYPE flask_http_request_duration_seconds histogram",
+            ]
+            for endpoint, histogram in sorted(self._durations.items()):
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    labels = _labels(endpoint=endpoint, le=bound)
+                    lines.append(f"flask_http_request_duration_seconds_bucket{labels} {count}")
+                labels = _labels(endpoint=endpoint, le="+Inf")
+                lines.append(f"flask_http_request_duration_seconds_bucket{labels} {histogram[-1]}")
+                labels = _labels(endpoint=endpoint)
+                lines.append(f"flask_http_request_duration_seconds_sum{labels} {histogram[-2]}")
+                lines.append(f"flask_http_request_duration_seconds_count{labels} {histogram[-1]}")
+
+            for index, name, help_text in (
+                (0, "flask_sql_queries_total", "SQL statements executed."),
+                (1, "flask_sql_duration_seconds_total", "Time spent executing SQL."),
+                (2, "flask_sql_rows_total", "Rows fetched from SQLite."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for endpoint, sql in sorted(self._sql.items()):
+                    lines.append(f"{name}{_labels(endpoint=endpoint)} {sql[index]}")
+
+            lines += [
+                "# HELP flask_phase_duration_seconds_total Time spent in named phases.",
+                "# TYPE flask_phase_duration_seconds_total counter",
+            ]
+            for (endpoint, name), seconds in sorted(self._phases.items()):
+                labels = _labels(endpoint=endpoint, phase=name)
+                lines.append(f"flask_phase_duration_seconds_total{labels} {seconds}")
+
+            lines += [
+                "# HELP flask_profiles_written_total Profiles of slow requests written.",
+                "# TYPE flask_profiles_written_total counter",
+                f"flask_profiles_written_total {self._profiles_written}",
+            ]
+
+        for prefix, collect in self._sources:
+            for key, value in collect().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE {prefix}_{key} untyped", f"{prefix}_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def configure(config):
+    """Make the SQLite connections count the rows they return. Must run
+    after `storage.configure` and before `SQLAlchemy(app)` creates the
+    engines, and only when instrumentation is enabled.
+    """
+    if not enabled(config):
+        return
+    config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"factory": CountingConnection}
+    for bind in config.get("SQLALCHEMY_BINDS", {}).values():
+        bind["connect_args"] = {"factory": CountingConnection}
+
+
+def enabled(config):
+    return str(config.get("INSTRUMENTATION", "")).lower() in ("1", "true", "yes", "on")
+
+
+def from_config(config):
+    """Build the instrumentation described by the app config, or None if
+    it is disabled:
+
+    INSTRUMENTATION               "1" to turn it on
+    INSTRUMENTATION_SLOW_MS       profiles of faster requests are discarded (100)
+    INSTRUMENTATION_PROFILE_RATE  fraction of requests profiled (0, only on demand)
+    INSTRUMENTATION_PROFILE_DIR   where profiles are written
+    """
+    if not enabled(config):
+        return None
+    return Instrumentation(
+        slow_ms=float(config.get("INSTRUMENTATION_SLOW_MS", 100)),
+        profile_rate=float(config.get("INSTRUMENTATION_PROFILE_RATE", 0)),
+        profile_dir=config.get("INSTRUMENTATION_PROFILE_DIR"),
+    )
@@ -2,7 +2,12 @@
 
 
 class Node:
-    """Node class to hold data and point to the next node."""
+    """Node class to hold data and point to the next node. `__slots__`
+    stores the two fields inline instead of in a per-node dict, which
+    more than halves the memory of a node.
+    """
+
+    __slots__ = ("data", "next_")
 
     def __init__(self, data=None, next_=None):
         self.data = data
@@ -13,25 +18,43 @@ class Node:
 
 
 class LinkedList:
-    """LinkedList wrapper to keep track of the head and tail nodes."""
+    """LinkedList wrapper to keep track of the head and tail nodes.
+
+    The length is kept up to date, so `len` is O(1), and iterating yields
+    the data of each node without building a list. With `index_key` set
+    (e.g. "id"), a dict from `data[index_key]` to its node is maintained
+    as well, making keyed lookups like `get_user_by_id` O(1). When several
+    nodes share a key, the one nearest the head is found, as a scan would.
+    """
+
+    __slots__ = ("head", "tail", "_length", "index_key", "_index")
 
-    def __init__(self):
+    def __init__(self, iterable=None, index_key=None):
         self.head = None
         self.tail = None
+        self._length = 0
+        self.index_key = index_key
+        self._index = {} if index_key is not None else None
+        if iterable is not None:
+            self.extend(iterable)
 
-    def to_list(self):
-        """Convert linked list to a normal Python list."""
-        alist = []
-        if self.head is None:
-            return alist
-        
-        # traverse through linked list
+    @classmethod
+    def from_iterable(cls, iterable, index_key=None):
+        """Build a linked list holding the items of `iterable` in order."""
+        return cls(iterable, index_key)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
         node = self.head
-        while node:
-            alist.append(node.data)
+        while node is not None:
+            yield node.data
             node = node.next_
-        
-        return alist
+
+    def to_list(self):
+        """Convert linked list to a normal Python list."""
+        return list(self)
 
     def __repr__(self):
         nodes = []
@@ -49,25 +72,20 @@ class LinkedList:
         return '-> '.join(nodes)
 
     def print_ll(self):
-        ll_string = ""
-        node = self.head
-        if node is None:
+        if self.head is None:
             print(None)
-        while node:
-            ll_string += f"{str(node.data)} -> "
-            node = node.next_
-
-        ll_string += "None"
-        print(ll_string)
+            return
+        print(" -> ".join(str(data) for data in self) + " -> None")
 
     def insert_beginning(self, data):
         """New node at beginning contains data, its next node is the head"""
-        if self.head is None:
-            self.head = Node(data, None)
+        self.head = Node(data, self.head)
+        if self.tail is None:
             self.tail = self.head
-        else:
-            new = Node(data, self.head)
-            self.head = new
+        self._length += 1
+        if self._index is not None:
+            # the new head shadows any older node with the same key
+            self._index[data[self.index_key]] = self.head
 
     def insert_at_end(self, data):
         """New node inserted at the end of linked list"""
@@ -77,14 +95,42 @@ class LinkedList:
 
         self.tail.next_ = Node(data, None)
         self.tail = self.tail.next_
+        self._length += 1
+        if self._index is not None:
+            self._index.setdefault(data[self.index_key], self.tail)
+
+    def extend(self, iterable):
+        """Append every item of `iterable`, linking the nodes in one pass
+        instead of going through `insert_at_end` for each.
+        """
+        iterator = iter(iterable)
+        if self.head is None:
+            for data in iterator:
+                self.insert_beginning(data)
+                break
+            else:
+                return
+        tail = self.tail
+        count = 0
+        index = self._index
+        key = self.index_key
+        for data in iterator:
+            tail.next_ = tail = Node(data, None)
+            count += 1
+            if index is not None:
+                index.setdefault(data[key], tail)
+        self.tail = tail
+        self._length += count
 
     def get_user_by_id(self, user_id):
         """Method to get the user specified by ID"""
+        user_id = int(user_id)
+        if self.index_key == "id":
+            node = self._index.get(user_id)
+            return node.data if node is not None else None
 
-        node = self.head
-        while node:
-            if node.data["id"] == int(user_id):
-                return node.data
-            node = node.next_
+        for data in self:
+            if data["id"] == user_id:
+                return data
 
-        return None
\ No newline at end of file
+        return None
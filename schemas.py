@@ -0,0 +1,92 @@
+"""Validation of JSON request bodies"""
+
+
+class ValidationError(Exception):
+    """Raised when a payload does not match its schema. `errors` maps each
+    offending field (or list index, for batches) to a message.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class Field:
+    """A field of a schema: the accepted Python type(s) once decoded from
+    JSON, and whether the field has to be present.
+    """
+
+    def __init__(self, types, required=True):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+
+
+class Schema:
+    """A flat JSON object schema. The per-field checks are compiled into
+    one tuple when the schema is created, so validating a payload is a
+    single pass with no per-request setup. Unknown fields are dropped.
+    """
+
+    def __init__(self, **fields):
+        self._checks = tuple(
+            (
+                name,
+                field.types,
+                field.required,
+                " or ".join(_TYPE_NAMES.get(t, t.__name__) for t in field.types),
+            )
+            for name, field in fields.items()
+        )
+
+    def validate(self, data):
+        """Return the validated fields of `data` as a new dict, or raise
+        ValidationError listing every problem found.
+        """
+        if not isinstance(data, dict):
+            raise ValidationError({"_schema": "expected a JSON object"})
+
+        cleaned = {}
+        errors = {}
+        for name, types, required, type_names in self._checks:
+            if name not in data:
+                if required:
+                    errors[name] = "missing required field"
+                continue
+            value = data[name]
+            # bool is a subclass of int, but true/false is never a number here
+            if not isinstance(value, types) or (
+                isinstance(value, bool) and bool not in types
+            ):
+                errors[name] = f"expected {type_names}"
+                continue
+            cleaned[name] = value
+
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def validate_many(self, items, max_items=None):
+        """Validate a JSON array of objects, reporting errors by index."""
+        if not isinstance(items, list) or not items:
+            raise ValidationError({"_schema": "expected a non-empty JSON array"})
+        if max_items is not None and len(items) > max_items:
+            raise ValidationError(
+                {"_schema": f"at most {max_items} items per request"}
+            )
+
+        cleaned = []
+        errors = {}
+        for i, item in enumerate(items):
+            try:
+                cleaned.append(self.validate(item))
+            except ValidationError as error:
+                errors[i] = error.errors
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+
+_TYPE_NAMES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+BLOG_POST_SCHEMA = Schema(title=Field(str), body=Field(str))
@@ -0,0 +1,104 @@
+"""JSON encoding of API responses"""
+import collections
+import datetime
+import hashlib
+import json
+
+from flask import Response, request
+
+import instrumentation
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+
+# An encoded JSON document and its entity tag. This is what gets cached, so
+# a cache hit needs neither a query nor encoding, and a conditional request
+# can be answered by comparing tags. A page of a listing also carries the
+# cursor of the next page, None on the last one.
+Encoded = collections.namedtuple("Encoded", ["body", "etag", "cursor"], defaults=[None])
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Encode `obj` as compact JSON bytes with sorted keys, using orjson
+    when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+        default=_default
+    ).encode("utf-8")
+
+
+def etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def encode(obj):
+    with instrumentation.phase("json"):
+        body = dumps(obj)
+    return Encoded(body, etag(body))
+
+
+def join_array(fragments):
+    """Concatenate already encoded JSON values into one encoded array."""
+    with instrumentation.phase("json"):
+        body = b"[" + b",".join(fragments) + b"]"
+    return Encoded(body, etag(body))
+
+
+def join_object(fields):
+    """Build one encoded object from {name: already encoded JSON value},
+    with its keys sorted like `dumps` sorts them.
+    """
+    with instrumentation.phase("json"):
+        body = b"{" + b",".join(
+            dumps(name) + b":" + value for name, value in sorted(fields.items())
+        ) + b"}"
+    return Encoded(body, etag(body))
+
+
+def json_response(encoded, status=200):
+    """Response for an encoded document, or an empty 304 if the client's
+    If-None-Match already names its entity tag. The comparison is weak, so
+    the weak tag of a compressed copy of the document matches too.
+    """
+    if request.if_none_match.contains_weak(encoded.etag):
+        # the media type lets compression give it the headers of the 200
+        response = Response(status=304, mimetype="application/json")
+    else:
+        response = Response(encoded.body, status=status, mimetype="application/json")
+    response.set_etag(encoded.etag)
+    return response
+
+
+def _as_dict(row):
+    return row if isinstance(row, dict) else row._asdict()
+
+
+def stream_array(rows):
+    """Encode rows (result rows or dicts) one at a time as a JSON array, so
+    the whole listing is never held in memory and the first bytes go out
+    immediately.
+    """
+    yield b"["
+    separator = b""
+    for row in rows:
+        yield separator + dumps(_as_dict(row))
+        separator = b","
+    yield b"]"
+
+
+def stream_ndjson(rows):
+    """Encode rows as newline delimited JSON, one object per line."""
+    for row in rows:
+        yield dumps(_as_dict(row)) + b"\n"
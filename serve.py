@@ -0,0 +1,261 @@
+"""Production launcher: pre-forked worker processes, each serving requests
+from a bounded pool of threads.
+
+    python serve.py --bind 0.0.0.0:8000 --workers 4 --threads 8
+
+The master process opens the listening socket and forks the workers,
+which all accept from it, so the kernel spreads connections over them.
+Workers import the app only after the fork, so no SQLite connection is
+ever shared between processes. Each worker reads posts and users from
+the database and, within CACHE_SYNC_INTERVAL (0.1 s by default), drops
+from its own cache the rows other workers wrote to, so any worker can
+serve any request.
+
+Signals sent to the master:
+
+    SIGHUP   graceful reload: start fresh workers (re-importing the code),
+             then stop the old ones once the new ones are up
+    SIGTERM  graceful shutdown: workers stop accepting and finish the
+    SIGINT   requests they are serving, then exit
+    SIGTTIN  add a worker, SIGTTOU remove one
+
+Workers that die are replaced. Where `os.fork` is unavailable (Windows),
+the app is served by a single process with the same thread pool.
+"""
+import argparse
+import concurrent.futures
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Seconds a keep-alive connection may sit idle before its thread is freed
+KEEPALIVE_TIMEOUT = 5
+
+# Seconds a stopping worker gets to finish its requests before SIGKILL
+GRACEFUL_TIMEOUT = 30
+
+
+class _RequestHandler(WSGIRequestHandler):
+    timeout = KEEPALIVE_TIMEOUT
+    access_log = False
+
+    def log_request(self, code="-", size="-"):
+        # one stderr line per request is a real cost under load
+        if self.access_log:
+            super().log_request(code, size)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server that hands each connection to a fixed-size
+    thread pool. Handlers run blocking SQLite calls, so they need threads,
+    but a bounded number of them: when every thread is busy the accept
+    loop waits, connections queue in the listen backlog, and other worker
+    processes pick them up.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            threads, thread_name_prefix="request"
+        )
+        self._free_threads = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self._free_threads.acquire()
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_threads.release()
+
+    def wait_for_requests(self):
+        """Block until the requests already handed to the pool are done."""
+        self._pool.shutdown(wait=True)
+
+
+def load_app(spec):
+    """Import `module:attribute`. The attribute is either a Flask app or an
+    application factory, which is called without arguments.
+    """
+    module_name, _, attribute = spec.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute or "app")
+    if not hasattr(app, "wsgi_app"):
+        app = app()
+    return app
+
+
+def run_worker(spec, listener, threads):
+    """Serve requests from the inherited listening socket until SIGTERM,
+    then call the app's `app.extensions["shutdown"]` hook, if it has one,
+    so it can drain its background work: workers leave with `os._exit`,
+    which skips atexit handlers.
+    """
+    app = load_app(spec)
+    host, port = listener.getsockname()[:2]
+    server = PooledWSGIServer(host, port, app, threads, fd=listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it cannot be
+        # called from the signal handler running inside serve_forever
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.wait_for_requests()
+        shutdown = app.extensions.get("shutdown")
+        if shutdown is not None:
+            shutdown()
+
+
+class Master:
+    """Forks, watches and replaces the worker processes."""
+
+    def __init__(self, spec, listener, workers, threads):
+        self.spec = spec
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.pids = {}  # pid -> time it was started
+        self._signals = []
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # only the master reacts to these
+            for signum in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            status = 0
+            try:
+                run_worker(self.spec, self.listener, self.threads)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        self.pids[pid] = time.monotonic()
+        return pid
+
+    def stop_workers(self, pids, timeout=GRACEFUL_TIMEOUT):
+        """SIGTERM the given workers, waiting up to `timeout` for them to
+        drain before killing them.
+        """
+        for pid in pids:
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    remaining.discard(pid)
+            time.sleep(0.1)
+        for pid in remaining:
+            self._kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        for pid in pids:
+            self.pids.pop(pid, None)
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        """Forget workers that exited, returning how many of them died
+        within a second of starting (most likely failing to import the app).
+        """
+        crashed = 0
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return crashed
+            if not pid:
+                return crashed
+            started = self.pids.pop(pid, None)
+            if started is not None and time.monotonic() - started < 1:
+                crashed += 1
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                       signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, lambda signum, frame: self._signals.append(signum))
+
+        for _ in range(self.workers):
+            self.spawn()
+        host, port = self.listener.getsockname()[:2]
+        print(
+            f"serving {self.spec} on http://{host}:{port} with "
+            f"{self.workers} workers x {self.threads} threads (pid {os.getpid()})",
+            file=sys.stderr,
+        )
+
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.stop_workers(list(self.pids))
+                    return
+                if signum == signal.SIGHUP:
+                    old = list(self.pids)
+                    for _ in range(self.workers):
+                        self.spawn()
+                    self.stop_workers(old)
+                elif signum == signal.SIGTTIN:
+                    self.workers += 1
+                elif signum == signal.SIGTTOU and self.workers > 1:
+                    self.workers -= 1
+                    self.stop_workers([max(self.pids, key=self.pids.get)])
+
+            if self._reap():
+                time.sleep(1)  # do not fork in a tight loop if the app is broken
+            while len(self.pids) < self.workers:
+                self.spawn()
+            time.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="server:create_app", help="module:app or module:factory")
+    parser.add_argument("--bind", default="127.0.0.1:5000", help="host:port to listen on")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="worker processes (default: one per CPU)",
+    )
+    parser.add_argument("--threads", type=int, default=8, help="request threads per worker")
+    parser.add_argument("--backlog", type=int, default=2048, help="listen backlog")
+    parser.add_argument("--access-log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args(argv)
+    _RequestHandler.access_log = args.access_log
+
+    host, _, port = args.bind.rpartition(":")
+    listener = socket.create_server((host or "127.0.0.1", int(port)), backlog=args.backlog)
+    listener.set_inheritable(True)
+
+    if not hasattr(os, "fork"):
+        run_worker(args.app, listener, args.threads)
+        return
+    Master(args.app, listener, args.workers, args.threads).run()
+
+
+if __name__ == "__main__":
+    main()
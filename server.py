@@ -1,43 +1,257 @@
 # Dependencies
+import atexit
+import contextlib
+import functools
+import hashlib
+import heapq
+import itertools
+import operator
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from sqlite3 import Connection as SQLite3Connection
-from datetime import datetime
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
-from flask import Flask, json, request, jsonify
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import create_engine, event, tuple_
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import IntegrityError, OperationalError
+from flask import (
+    Blueprint, Flask, Response, current_app, g, request, jsonify, send_file,
+    stream_with_context, url_for
+)
+import click
 from flask_sqlalchemy import SQLAlchemy
-import linked_list
-import hash_table
-import binary_search_tree
-import custom_queue
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import IntegerConverter
+import cache
+import checksum
+import compaction
+import compression
+import export
+import instrumentation
+import schemas
+import serializers
+import sharding
+import storage
+import task_queue
 
-import random
+# Settings copied from the environment into the config of a new app
+ENVIRONMENT_SETTINGS = (
+    # Read-through cache settings, see `cache.from_config`
+    "CACHE_BACKEND", "CACHE_TTL", "CACHE_MAX_ENTRIES", "CACHE_PATH",
+    # Seconds between two reads of the change log by a worker with a local
+    # cache, see `_sync_local_cache`
+    "CACHE_SYNC_INTERVAL",
+    # Storage profile (`wal` or `baseline`): SQLite pragmas, pool sizes and
+    # the read-only connection pool used by the GET endpoints
+    "SQLITE_PROFILE",
+    # Opt-in request, SQL and profiling metrics, see `instrumentation.from_config`
+    "INSTRUMENTATION", "INSTRUMENTATION_SLOW_MS",
+    "INSTRUMENTATION_PROFILE_RATE", "INSTRUMENTATION_PROFILE_DIR",
+    # Soft delete: DELETE /blog_post/<id> only marks the post as deleted, and
+    # a background job purges marked posts in batches, see `compaction`
+    "SOFT_DELETE", "COMPACTION_INTERVAL", "COMPACTION_BATCH_SIZE", "COMPACTION_GRACE",
+    # Directory where complete table exports are kept between requests
+    # (`exports` in the instance folder by default)
+    "EXPORT_DIR",
+    # Background computation of derived fields, see `task_queue.from_config`
+    "DERIVED_WORKERS", "DERIVED_BATCH_SIZE", "DERIVED_QUEUE_SIZE", "DERIVED_PUT_TIMEOUT",
+    # Number of SQLite files users and their posts are spread over, see `sharding`
+    "SHARDS",
+    # Content-negotiated response compression, see `compression.from_config`
+    "COMPRESSION", "COMPRESSION_MIN_SIZE", "COMPRESSION_LEVEL",
+)
 
-# Flask app
-app = Flask(__name__)
+# Create a database instance, connected to each app by `create_app`
+db = SQLAlchemy()
 
-# Configure SQLite database file
-# SQLAlchemy is object-relational mapper, OOP for SQL
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///sqlitedb.file"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = 0
+# Routes and CLI commands of the API, registered on each app
+api = Blueprint("api", __name__, cli_group=None)
+
+
+def create_app(config=None):
+    """Application factory: a new app configured from the environment,
+    then from the `config` dict if given (tests, scripts).
+
+    Creating an app does not touch the database. The schema is brought up
+    to date and the background workers are started before the first
+    request is handled (see `_before_first_request`), so worker processes,
+    tests and CLI commands that need neither start quickly.
+    """
+    app = Flask(__name__)
+
+    # Configure SQLite database file
+    # SQLAlchemy is object-relational mapper, OOP for SQL
+    # `DATABASE_URL` lets benchmarks and scripts point the app at another file
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "DATABASE_URL", "sqlite:///sqlitedb.file"
+    )
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = 0
+    for name in ENVIRONMENT_SETTINGS:
+        if name in os.environ:
+            app.config[name] = os.environ[name]
+    if config:
+        app.config.update(config)
+    storage.configure(app.config)
+    instrumentation.configure(app.config)
+
+    db.init_app(app)
+    services = app.extensions["api"] = Services(app)
+    app.extensions["shutdown"] = services.shutdown
+    with app.app_context():
+        _listen_for_connections(db.engines, app.config["SQLITE_PRAGMAS"])
+        if services.shards > 1:
+            services.id_allocator = sharding.IdAllocator(db.engine)
+
+    if services.metrics is not None:
+        services.metrics.init_app(app)
+    # after the metrics, so its hook runs first and is timed by theirs
+    if services.compression is not None:
+        services.compression.init_app(app)
+    # before the blueprint, whose rules look the converter up when added
+    app.url_map.converters["int"] = IdConverter
+    app.register_blueprint(api)
+    app.teardown_appcontext(_close_read_connections)
+    return app
+
+
+class IdConverter(IntegerConverter):
+    """The `int` route converter, limited to what a SQLite INTEGER holds,
+    so `/user/<huge number>` is a 404 rather than an OverflowError from
+    the query. Raising NotFound, not the converter's usual ValidationError,
+    keeps the router from answering 405 because another method's rule
+    has the same path.
+    """
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value > storage.MAX_INTEGER:
+            raise NotFound()
+        return value
+
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """`server.app` is an app made by `create_app()` on first access, so
+    `flask --app server`, `serve.py server:app` and scripts keep working
+    while merely importing this module stays cheap.
+    """
+    global _default_app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
 
 # Configure SQLite3 to enforce foreign key constraints
 
 
-@event.listens_for(Engine, "connect")
-def _set_sqlite_pragma(dbapi_connection, connection_record):
+def _set_sqlite_pragma(pragmas, dbapi_connection, connection_record):
     """Looks like once the DB Engine is connected, 
-    foreign key constraints are turned on.
+    foreign key constraints are turned on. The pragmas of the storage
+    profile are applied at the same time.
     """
 
     if isinstance(dbapi_connection, SQLite3Connection):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON;")
         cursor.close()
+        storage.apply_pragmas(dbapi_connection, pragmas)
+
+
+def _listen_for_connections(engines, pragmas):
+    """Register `_set_sqlite_pragma` on each engine of an app. Listening on
+    the engines rather than on the `Engine` class keeps apps with other
+    settings, and any other engine in the process, unaffected. Connections
+    of the read pool also get `query_only`, so they can never write by
+    accident.
+    """
+    for bind, engine in engines.items():
+        if storage.is_read_bind(bind):
+            engine_pragmas = {**pragmas, "query_only": "ON"}
+        else:
+            engine_pragmas = pragmas
+        event.listen(engine, "connect", functools.partial(_set_sqlite_pragma, engine_pragmas))
+
+
+class Services:
+    """What an app keeps besides its config: the cache, the metrics, the
+    export snapshots and the background workers. Stored in
+    `app.extensions["api"]`, see `_services`.
+    """
+
+    def __init__(self, app):
+        # Cache for the GET endpoints, invalidated by the write endpoints
+        self.cache = cache.from_config(app.config)
+
+        # Position in the change log of each shard up to which this
+        # process's cache has dropped the rows written to, when the cache
+        # is its own and has to notice the writes of other processes. The
+        # log is read at most every CACHE_SYNC_INTERVAL seconds, which
+        # bounds how long another worker's write can go unnoticed.
+        self.change_log_seen = None if self.cache.backend.shared else {}
+        self.change_log_interval = float(app.config.get("CACHE_SYNC_INTERVAL", 0.1))
+        self.change_log_read_at = float("-inf")
+        self.change_log_lock = threading.Lock()
+
+        # Served on `/metrics` when enabled, together with the cache counters
+        self.metrics = instrumentation.from_config(app.config)
+        if self.metrics is not None:
+            self.metrics.add_source("api_cache", self.cache.stats)
+
+        # Compresses responses for clients that accept it, on by default
+        self.compression = compression.from_config(app.config)
+
+        # Complete exports, kept on disk until the table changes
+        self.export_snapshots = export.SnapshotStore(
+            app.config.get("EXPORT_DIR") or os.path.join(app.instance_path, "exports")
+        )
+
+        # Purges soft-deleted posts every COMPACTION_INTERVAL seconds when set
+        self.compactor = compaction.Compactor(
+            lambda batch_size: purge_deleted_posts_batch(
+                app, batch_size, float(app.config.get("COMPACTION_GRACE", 0))
+            ),
+            interval=float(app.config.get("COMPACTION_INTERVAL") or 0),
+            batch_size=int(app.config.get("COMPACTION_BATCH_SIZE", 500)),
+        )
+
+        # Worker threads computing derived fields, started with the app
+        self.derived_pipeline = None
+
+        # False when SQLite was built without FTS5, which turns search off
+        self.search_available = True
+
+        # With several shards, ids come from the allocator rather than from
+        # SQLite, and the list endpoints query the shards in parallel
+        self.shards = app.config["SHARDS"]
+        self.id_allocator = None
+        self.shard_pool = None
+        if self.shards > 1:
+            self.shard_pool = ThreadPoolExecutor(self.shards, thread_name_prefix="shard")
+
+        self.schema_ready = False
+        self.started = False
+        self.lock = threading.Lock()
+
+    def shutdown(self):
+        """Stop the background workers, finishing the queued work. Runs at
+        exit, and is also the app's `app.extensions["shutdown"]` hook for
+        launchers such as serve.py, whose workers skip atexit handlers.
+        """
+        if self.derived_pipeline is not None:
+            self.derived_pipeline.shutdown()
+        self.compactor.stop()
 
 
-# Create a database instance to connect DB with Flask App
-db = SQLAlchemy(app)
-now = datetime.now()
+def _services():
+    """The `Services` of the current app."""
+    return current_app.extensions["api"]
 
 # Class models for each table in the database
 
@@ -64,184 +278,1496 @@ class BlogPost(db.Model):
     body = db.Column(db.String(256))
     date = db.Column(db.Date)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # sum of the code points of `body`, computed once when the post is
+    # inserted. A column default (rather than an ORM event) so that bulk
+    # Core inserts fill it in as well.
+    numeric_body = db.Column(
+        db.Integer,
+        default=lambda context: _numeric_body_default(context)
+    )
+
+    # when the post was soft-deleted; NULL for live posts
+    deleted_at = db.Column(db.DateTime)
+
+    # A user's posts by date: serves the per-user listing in index order,
+    # and the foreign key check and cascade when a user is deleted
+    __table_args__ = (
+        db.Index("ix_blog_post_user_id_date_id", "user_id", "date", "id"),
+    )
+
+
+def _numeric_body_default(context):
+    """The checksum of a new post, or NULL when the background workers
+    compute it after the insert instead.
+    """
+    if _services().derived_pipeline is not None:
+        return None
+    return checksum.numeric_body(context.get_current_parameters().get("body"))
+
+
+def _column_names(engine, table):
+    return {column["name"] for column in db.inspect(engine).get_columns(table)}
+
+
+def _add_column(engine, table, name, sql_type):
+    """Add a column that databases made by older versions lack."""
+    if name in _column_names(engine, table):
+        return
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"
+            )
+    except OperationalError:
+        if name not in _column_names(engine, table):
+            raise
+
+
+def upgrade_schema(batch_size=1000):
+    """Create missing tables and bring databases made by older versions
+    of this app up to date: add the `numeric_body` and `deleted_at`
+    columns and fill in `numeric_body` for existing posts, in batches so
+    large tables are not read at once, and create missing indexes and the
+    full-text search index. Every shard is upgraded the same way.
+    """
+    for shard in _shards():
+        _upgrade_shard(_engine(shard), batch_size)
+    if _services().id_allocator is not None:
+        _initialize_id_sequences()
+
+
+def _upgrade_shard(engine, batch_size):
+    # Several worker processes may start at once and race each other
+    # here, so a DDL statement failing because another process already
+    # ran it is not an error.
+    try:
+        db.metadata.create_all(engine)
+    except OperationalError:
+        db.metadata.create_all(engine)
+    _add_column(engine, "blog_post", "numeric_body", "INTEGER")
+    _add_column(engine, "blog_post", "deleted_at", "DATETIME")
+    # create_all only creates indexes together with their table
+    with engine.begin() as connection:
+        for index in BlogPost.__table__.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+    _create_search_index(engine)
+    with engine.begin() as connection:
+        for statement in TABLE_CHANGE_DDL:
+            connection.exec_driver_sql(statement)
+
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                db.select(BlogPost.id, BlogPost.body)
+                .where(BlogPost.numeric_body.is_(None), BlogPost.body.is_not(None))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            _store_numeric_bodies(connection, rows)
+
+
+def _store_numeric_bodies(connection, rows):
+    """Compute and store the `numeric_body` of (id, body) rows with one
+    executemany UPDATE.
+    """
+    sums = checksum.numeric_bodies(row.body for row in rows)
+    connection.execute(
+        db.update(BlogPost)
+        .where(BlogPost.id == db.bindparam("post_id"))
+        .values(numeric_body=db.bindparam("post_sum")),
+        [
+            {"post_id": row.id, "post_sum": numeric_body}
+            for row, numeric_body in zip(rows, sums)
+        ]
+    )
+
+
+def _initialize_id_sequences():
+    """Start the id sequences of the sharded tables after the largest id
+    of any shard, for shards filled before sharding was turned on.
+    """
+    for name, model in (("user", User), ("blog_post", BlogPost)):
+        largest = [
+            connection.execute(db.select(db.func.max(model.id))).scalar()
+            for connection in map(_read_connection, _shards())
+        ]
+        _services().id_allocator.initialize(
+            name, max(filter(None, largest), default=0)
+        )
+
+
+# A log of the rows written to, filled by triggers on every write from
+# any process. Workers read the entries added since they last looked to
+# drop just those rows from their own cache (see `_sync_local_cache`).
+# Only the columns the API returns count as a change to blog_post, so
+# the background checksum updates do not. The log keeps its last 10000
+# entries; a worker that falls further behind, or finds a '*' entry
+# (see `bulk_load`), drops everything it cached instead.
+TABLE_CHANGE_DDL = (
+    "CREATE TABLE IF NOT EXISTS table_change ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, row_id INTEGER NOT NULL)",
+    "CREATE TRIGGER IF NOT EXISTS table_change_prune AFTER INSERT ON table_change "
+    "WHEN new.seq % 1000 = 0 BEGIN "
+    "DELETE FROM table_change WHERE seq <= new.seq - 10000; END",
+    "CREATE TRIGGER IF NOT EXISTS user_change_insert AFTER INSERT ON user BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('user', new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS user_change_update AFTER UPDATE ON user BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('user', new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS user_change_delete AFTER DELETE ON user BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('user', old.id); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_change_insert AFTER INSERT ON blog_post BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('blog_post', new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_change_update "
+    "AFTER UPDATE OF title, body, user_id, deleted_at ON blog_post BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('blog_post', new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_change_delete AFTER DELETE ON blog_post BEGIN "
+    "INSERT INTO table_change (name, row_id) VALUES ('blog_post', old.id); END",
+    # the per-table counters of earlier versions, bumped by every row
+    *(
+        f"DROP TRIGGER IF EXISTS {table}_version_{event}"
+        for table in ("user", "blog_post") for event in ("insert", "update", "delete")
+    ),
+    "DROP TABLE IF EXISTS table_version",
+)
+
+# Cache keys of the single entities of each logged table
+TABLE_CACHE_PREFIXES = {"user": "user:", "blog_post": "blog_post:"}
+
+# Most change log entries a worker applies one by one before it drops
+# everything it cached instead
+CHANGE_LOG_BATCH = 1000
+
+
+def _change_log_positions():
+    """Sequence number of the latest change log entry of each shard. It
+    never goes back, even when the entry is pruned.
+    """
+    return tuple(_scatter(lambda shard: _read_connection(shard).exec_driver_sql(
+        "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'table_change'"
+    ).scalar()))
+
+
+def _read_changes(shard, seen):
+    """The change log entries of `shard` after position `seen`, as the new
+    position and a list of (table, row id), or None for a gap in the log,
+    when everything must be dropped.
+    """
+    connection = _read_connection(shard)
+    rows = connection.exec_driver_sql(
+        "SELECT seq, name, row_id FROM table_change WHERE seq >= ? ORDER BY seq LIMIT ?",
+        (seen, CHANGE_LOG_BATCH + 2)
+    ).all()
+    if seen:
+        # the entry at `seen` itself is still there unless it was pruned
+        gap = not rows or rows[0].seq != seen
+        rows = rows[1:]
+    else:
+        gap = bool(rows) and rows[0].seq != 1
+    if gap or len(rows) > CHANGE_LOG_BATCH or any(row.name == "*" for row in rows):
+        position = connection.exec_driver_sql(
+            "SELECT coalesce(max(seq), 0) FROM table_change"
+        ).scalar()
+        return position, None
+    return (rows[-1].seq if rows else seen), [(row.name, row.row_id) for row in rows]
+
+
+# Full-text index over post titles and bodies. An FTS5 external content
+# table stores only the index, reading the text from `blog_post` itself,
+# and the triggers keep it in step with every write, including bulk
+# inserts that bypass the ORM. Only live posts are indexed: a soft delete
+# removes the post from the index, so purging it later must not.
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5("
+    "title, body, content='blog_post', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_insert AFTER INSERT ON blog_post BEGIN "
+    "INSERT INTO blog_post_fts (rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_delete AFTER DELETE ON blog_post "
+    "WHEN old.deleted_at IS NULL BEGIN "
+    "INSERT INTO blog_post_fts (blog_post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_update "
+    "AFTER UPDATE OF title, body ON blog_post WHEN old.deleted_at IS NULL BEGIN "
+    "INSERT INTO blog_post_fts (blog_post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO blog_post_fts (rowid, title, body) "
+    "VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_soft_delete "
+    "AFTER UPDATE OF deleted_at ON blog_post "
+    "WHEN old.deleted_at IS NULL AND new.deleted_at IS NOT NULL BEGIN "
+    "INSERT INTO blog_post_fts (blog_post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+)
+
+
+def _create_search_index(engine):
+    """Create the full-text index and its triggers, indexing the existing
+    posts if the index is new.
+    """
+    with engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'blog_post_fts'"
+        ).first()
+        try:
+            for statement in SEARCH_INDEX_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError as error:
+            if "fts5" not in str(error):
+                raise
+            _services().search_available = False
+            return
+    if not exists:
+        _reindex_search(engine)
+
+
+def reindex_search():
+    """Rebuild the full-text index of every shard from its `blog_post`
+    table and merge its segments, for databases filled before the index
+    existed or written to by the app during a `bulk_load`.
+    """
+    for shard in _shards():
+        _reindex_search(_engine(shard))
+
+
+def _reindex_search(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO blog_post_fts (blog_post_fts) VALUES ('rebuild')"
+        )
+        # the rebuild indexes every row, soft-deleted posts included
+        connection.exec_driver_sql(
+            "INSERT INTO blog_post_fts (blog_post_fts, rowid, title, body) "
+            "SELECT 'delete', id, title, body FROM blog_post "
+            "WHERE deleted_at IS NOT NULL"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO blog_post_fts (blog_post_fts) VALUES ('optimize')"
+        )
+
+
+@api.cli.command("reindex-search")
+def reindex_search_command():
+    """Rebuild the full-text search index of blog posts."""
+    init_db()
+    reindex_search()
+    print("search index rebuilt")
+
+
+# Triggers run for every inserted row, which more than doubles the time
+# of a large insert, so `bulk_load` drops them for its duration
+BULK_LOAD_TRIGGERS = tuple(
+    statement.split()[5]
+    for statement in SEARCH_INDEX_DDL + TABLE_CHANGE_DDL
+    if statement.startswith("CREATE TRIGGER")
+)
+
+
+@contextlib.contextmanager
+def bulk_load():
+    """Drop the search index and change log triggers of every shard for
+    the duration of a bulk insert of new users and posts. Afterwards the
+    new posts are added to the search index, the triggers are created
+    again and a '*' change log entry makes every worker drop what it
+    cached. Writes by the app in the meantime are not tracked, so it is
+    meant for loads while the app is stopped or idle.
+    """
+    largest = []
+    for shard in _shards():
+        with _engine(shard).begin() as connection:
+            largest.append(
+                connection.execute(db.select(db.func.max(BlogPost.id))).scalar() or 0
+            )
+            for name in BULK_LOAD_TRIGGERS:
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        for shard, after_id in zip(_shards(), largest):
+            _finish_bulk_load(_engine(shard), after_id)
+
+
+def _finish_bulk_load(engine, after_id):
+    with engine.begin() as connection:
+        if connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'blog_post_fts'"
+        ).first():
+            connection.exec_driver_sql(
+                "INSERT INTO blog_post_fts (rowid, title, body) "
+                "SELECT id, title, body FROM blog_post "
+                "WHERE id > ? AND deleted_at IS NULL",
+                (after_id,)
+            )
+    _create_search_index(engine)
+    with engine.begin() as connection:
+        for statement in TABLE_CHANGE_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(
+            "INSERT INTO table_change (name, row_id) VALUES ('*', 0)"
+        )
+
+
+def purge_deleted_posts_batch(app, batch_size, grace=0):
+    """Hard-delete up to `batch_size` posts soft-deleted more than `grace`
+    seconds ago from each shard, in one short transaction per shard.
+    Returns how many were deleted.
+    """
+    cutoff = _utcnow() - timedelta(seconds=grace)
+    statement = db.delete(BlogPost).where(
+        BlogPost.id.in_(
+            db.select(BlogPost.id)
+            .where(BlogPost.deleted_at <= cutoff)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+    )
+    deleted = 0
+    with app.app_context():
+        for shard in _shards():
+            with _engine(shard).begin() as connection:
+                deleted += connection.execute(statement).rowcount
+    return deleted
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def soft_delete_enabled():
+    return str(current_app.config.get("SOFT_DELETE", "")).lower() in ("1", "true", "yes", "on")
+
+
+def compute_numeric_bodies(app, blog_post_ids):
+    """Fill in `numeric_body` for the given posts where it is missing, with
+    one query and one bulk update per shard.
+    """
+    query = db.select(BlogPost.id, BlogPost.body).where(
+        BlogPost.id.in_(blog_post_ids),
+        BlogPost.numeric_body.is_(None),
+        BlogPost.body.is_not(None)
+    )
+    with app.app_context():
+        for shard in _shards():
+            with _engine(shard).begin() as connection:
+                rows = connection.execute(query).all()
+                if rows:
+                    _store_numeric_bodies(connection, rows)
+
+
+@api.cli.command("purge-deleted-posts")
+def purge_deleted_posts_command():
+    """Hard-delete every soft-deleted blog post now, in batches."""
+    init_db()
+    print(f"{_services().compactor.run_once()} soft-deleted posts purged")
+
+
+@api.cli.command("reshard")
+@click.option("--from", "from_shards", type=int, required=True,
+              help="number of shards the data is spread over now")
+@click.option("--batch-size", type=int, default=500, help="users moved per transaction")
+def reshard_command(from_shards, batch_size):
+    """Move users and their posts from FROM shards to the SHARDS of the
+    current config. Run it after changing SHARDS, with the app stopped
+    (`--from 1` spreads an unsharded database).
+    """
+    init_db()
+    app = current_app._get_current_object()
+    urls = sharding.shard_urls(app.config["SQLALCHEMY_DATABASE_URI"], from_shards)
+    moved = 0
+    for source in range(from_shards):
+        if source < app.config["SHARDS"]:
+            moved += _move_users(_engine(source), source, batch_size)
+            continue
+        # a shard that is going away: not one of the app's engines
+        engine = create_engine(urls[source])
+        _listen_for_connections({None: engine}, app.config["SQLITE_PRAGMAS"])
+        try:
+            moved += _move_users(engine, source, batch_size)
+        finally:
+            engine.dispose()
+    if _services().id_allocator is not None:
+        _initialize_id_sequences()
+    print(f"{moved} users moved")
+
+
+def _move_users(source_engine, source, batch_size):
+    """Move the users of the shard `source` that belong on another shard,
+    `batch_size` users at a time, with their posts. The rows are copied to
+    their new shard before being deleted from the old one, so an
+    interrupted run loses nothing and can simply be run again. Posts
+    awaiting their purge are purged instead of moved. Returns how many
+    users were moved.
+    """
+    moved, after_id = 0, 0
+    while True:
+        with source_engine.connect() as connection:
+            user_ids = connection.scalars(
+                db.select(User.id).where(User.id > after_id).order_by(User.id).limit(batch_size)
+            ).all()
+        if not user_ids:
+            return moved
+        after_id = user_ids[-1]
+
+        by_shard = defaultdict(list)
+        for user_id in user_ids:
+            if _shard_of(user_id) != source:
+                by_shard[_shard_of(user_id)].append(user_id)
+        for target, ids in by_shard.items():
+            with source_engine.connect() as connection:
+                users = connection.execute(
+                    db.select(User.__table__).where(User.id.in_(ids))
+                ).all()
+                posts = connection.execute(
+                    db.select(BlogPost.__table__).where(
+                        BlogPost.user_id.in_(ids), BlogPost.deleted_at.is_(None)
+                    )
+                ).all()
+            with _engine(target).begin() as connection:
+                connection.execute(
+                    db.insert(User).prefix_with("OR IGNORE"),
+                    [user._asdict() for user in users]
+                )
+                if posts:
+                    connection.execute(
+                        db.insert(BlogPost).prefix_with("OR IGNORE"),
+                        [post._asdict() for post in posts]
+                    )
+            with source_engine.begin() as connection:
+                connection.execute(db.delete(BlogPost).where(BlogPost.user_id.in_(ids)))
+                connection.execute(db.delete(User).where(User.id.in_(ids)))
+            moved += len(ids)
+
+
+def init_db():
+    """Bring the database of the current app up to date, once per app.
+    Called before the first request, and by scripts and commands that use
+    the database directly.
+    """
+    services = _services()
+    with services.lock:
+        if not services.schema_ready:
+            upgrade_schema()
+            services.schema_ready = True
+
+
+@api.before_app_request
+def _before_first_request():
+    """Set the app up when it handles its first request: upgrade the
+    schema and start the background workers. Concurrent first requests
+    wait for the one doing it.
+    """
+    services = _services()
+    if services.started:
+        return
+    init_db()
+    with services.lock:
+        if services.started:
+            return
+        app = current_app._get_current_object()
+        if services.compactor.interval > 0:
+            services.compactor.start()
+
+        # With DERIVED_WORKERS set, new posts are inserted without their
+        # checksum and their ids queued for worker threads, which compute
+        # the checksums in batches; the request only pays for the insert.
+        pipeline = task_queue.from_config(
+            app.config, functools.partial(compute_numeric_bodies, app)
+        )
+        if pipeline is not None and services.metrics is not None:
+            services.metrics.add_source("derived_queue", pipeline.stats)
+        services.derived_pipeline = pipeline
+        # finish the queued work before the process exits
+        atexit.register(services.shutdown)
+        services.started = True
+
+
+@api.before_app_request
+def _sync_local_cache():
+    """Before a read, drop from this process's cache the rows another
+    worker process (or a command) wrote to, as the cache is only
+    invalidated by this process's own writes. The change log is read at
+    most once per interval, by one request at a time; the others go on
+    serving from the cache meanwhile.
+    """
+    services = _services()
+    if services.change_log_seen is None or request.method not in ("GET", "HEAD"):
+        return
+    now = time.monotonic()
+    if now - services.change_log_read_at < services.change_log_interval:
+        return
+    if not services.change_log_lock.acquire(blocking=False):
+        return
+    try:
+        services.change_log_read_at = now
+        seen = services.change_log_seen
+        first = not seen
+        results = _scatter(lambda shard: _read_changes(shard, seen.get(shard, 0)))
+        api_cache = services.cache
+        for shard, (position, changes) in zip(_shards(), results):
+            seen[shard] = position
+            # nothing is cached before the first read
+            if first:
+                continue
+            if changes is None:
+                for prefix in TABLE_CACHE_PREFIXES.values():
+                    api_cache.invalidate_prefix(prefix)
+                api_cache.invalidate_pages("users")
+                continue
+            api_cache.invalidate(*(
+                f"{TABLE_CACHE_PREFIXES[table]}{row_id}" for table, row_id in changes
+            ))
+            if any(table == "user" for table, _ in changes):
+                api_cache.invalidate_pages("users")
+    finally:
+        services.change_log_lock.release()
+
+
+def _shards():
+    """Numbers of the shards of the current app, 0 only when unsharded."""
+    return range(_services().shards)
+
+
+def _shard_of(user_id):
+    """The shard holding a user and all their posts."""
+    return sharding.shard_of(user_id, _services().shards)
+
+
+def _engine(shard=0):
+    """Engine writing to `shard`."""
+    return db.engines[storage.write_bind(shard)]
+
+
+def _read_connection(shard=0):
+    """Connection to `shard` from its read-only pool, shared by everything
+    a GET request reads and returned to the pool when the app context ends
+    (for streamed responses, after the last chunk is sent).
+    """
+    connections = g.setdefault("read_connections", {})
+    if shard not in connections:
+        connections[shard] = db.engines[storage.read_bind(shard)].connect()
+    return connections[shard]
+
+
+def _close_read_connections(exception):
+    for connection in g.pop("read_connections", {}).values():
+        connection.close()
+
+
+def _scatter(func, shards=None):
+    """[func(shard) for shard in `shards`], all of them by default, with
+    the shards queried in parallel when there are several.
+    """
+    return sharding.scatter(
+        _services().shard_pool, func, _shards() if shards is None else shards
+    )
+
+
+def _read_sorted(query, key, reverse=False, stream=False):
+    """Rows of `query` from every shard, in the order of `query`, which
+    must be sorted by `key`. The shards run the query in parallel and
+    their sorted rows are combined with a k-way merge. With `stream`, rows
+    are fetched as the merge consumes them instead of all up front.
+    """
+    def read(shard):
+        result = _read_connection(shard).execute(query)
+        return result if stream else result.all()
+
+    results = _scatter(read)
+    if len(results) == 1:
+        return iter(results[0])
+    return heapq.merge(*results, key=key, reverse=reverse)
+
+
+def _sqlite_int(value):
+    """`int(value)`, raising ValueError as well when it does not fit a
+    SQLite INTEGER, which the driver would refuse with OverflowError.
+    """
+    value = int(value)
+    if not storage.MIN_INTEGER <= value <= storage.MAX_INTEGER:
+        raise ValueError(f"{value} does not fit a SQLite INTEGER")
+    return value
+
+
+def _int_arg(name, default=None, minimum=None, maximum=None):
+    """Read an optional integer query string argument, or raise ValueError
+    if it is not one, does not fit a SQLite INTEGER or is below `minimum`.
+    Values above `maximum` are lowered to it.
+    """
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    value = _sqlite_int(value)
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
 
 
-@app.route("/user", methods=["POST"])
+@api.route("/user", methods=["POST"])
 def create_user():
     """Create route to route the POST request to this function,
     whenever the `/user` rule is appended to the URL. In simple
     terms, this function creates a new user and puts the data on the DB.
     """
     data = request.get_json()  # request object provided by Flask
-    new_user = User(
-        name=data["name"],
-        email=data["email"],
-        address=data["address"],
-        phone=data["phone"]
-    )
-    db.session.add(new_user)
-    db.session.commit()
+    new_user = {
+        "name": data["name"],
+        "email": data["email"],
+        "address": data["address"],
+        "phone": data["phone"]
+    }
+    services = _services()
+    if services.id_allocator is not None:
+        new_user["id"], = services.id_allocator.allocate("user")
+    with _engine(_shard_of(new_user.get("id", 0))).begin() as connection:
+        user_id, = connection.execute(db.insert(User), new_user).inserted_primary_key
+    # a lookup of this id may have cached "not found"
+    services.cache.invalidate(f"user:{user_id}")
+    services.cache.invalidate_pages("users")
     return jsonify({"message": "User created"}), 200
 
 
-@app.route("/user/descending_id", methods=["GET"])
-def get_all_users_descending():
-    """Get all users in descending order, after first storing their
-    data within a linked list. Returning 200 if successful.
+# Columns returned by the user endpoints, selected directly so listing
+# users does not have to build a full ORM object per row
+USER_COLUMNS = (User.id, User.name, User.email, User.address, User.phone)
+
+# Rows fetched from SQLite at a time when streaming a listing
+STREAM_BATCH_SIZE = 1000
+
+
+def _list_users(descending):
+    """Shared implementation of the ascending and descending user listings.
+
+    The order is pushed into SQL, and the sorted rows of the shards are
+    merged by id. With `limit`, one page is returned and
+    `after_id` is the keyset cursor: the id of the last user seen, so the
+    next page starts from the primary key index instead of an OFFSET scan.
+    A `Link` header points at the next page. Without `limit`, the whole
+    table is returned, optionally streamed row by row with `stream=json`
+    (a JSON array) or `stream=ndjson`.
+
+    A cached page is stored already encoded, and is built from the encoded
+    fragments of the single users it contains, which are cached under the
+    same keys as `get_one_user` uses.
     """
+    try:
+        after_id = _int_arg("after_id")
+        limit = _int_arg("limit", minimum=1, maximum=1000)
+    except ValueError:
+        return jsonify({"message": "after_id and limit must be integers, limit at least 1"}), 400
+    stream = request.args.get("stream")
+    if stream not in (None, "json", "ndjson"):
+        return jsonify({"message": "stream must be json or ndjson"}), 400
 
-    users = User.query.all()
-    all_users_ll = linked_list.LinkedList()
+    query = db.select(*USER_COLUMNS)
+    by_id = operator.attrgetter("id")
+    if descending:
+        query = query.order_by(User.id.desc())
+        if after_id is not None:
+            query = query.where(User.id < after_id)
+    else:
+        query = query.order_by(User.id)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
 
-    for user in users:
-        all_users_ll.insert_beginning(
-            {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "address": user.address,
-                "phone": user.phone
-            }
+    if limit is not None:
+        api_cache = _services().cache
+        page = api_cache.get_or_set(
+            api_cache.page_key(
+                "users", "desc" if descending else "asc", after_id, limit
+            ),
+            lambda: _encode_user_page(
+                itertools.islice(_read_sorted(query.limit(limit), by_id, descending), limit),
+                limit
+            )
         )
+        response = serializers.json_response(page)
+        if page.cursor is not None:
+            next_page = url_for(request.endpoint, after_id=page.cursor, limit=limit)
+            response.headers["Link"] = f'<{next_page}>; rel="next"'
+        return response
+
+    if stream is None:
+        return serializers.json_response(serializers.encode(
+            [row._asdict() for row in _read_sorted(query, by_id, descending)]
+        ))
 
-    return jsonify(all_users_ll.to_list()), 200
+    rows = _read_sorted(
+        query.execution_options(yield_per=STREAM_BATCH_SIZE), by_id, descending,
+        stream=True
+    )
+    if stream == "ndjson":
+        return Response(
+            stream_with_context(serializers.stream_ndjson(rows)),
+            mimetype="application/x-ndjson"
+        ), 200
+    return Response(
+        stream_with_context(serializers.stream_array(rows)),
+        mimetype="application/json"
+    ), 200
 
 
-@app.route("/user/ascending_id", methods=["GET"])
-def get_all_users_ascending():
-    """Get all users in ascending order, after first storing their
-    data within a linked list. Returning 200 if successful.
+def _encode_user_page(rows, limit):
+    """The encoded page of user `rows`, with the id of its last user as
+    the cursor of the next page when the page is full. Users whose
+    encoding is already cached are not encoded again.
     """
+    api_cache = _services().cache
+    rows = list(rows)
+    fragments = [
+        api_cache.get_or_set(
+            f"user:{row.id}", lambda row=row: serializers.encode(row._asdict())
+        ).body
+        for row in rows
+    ]
+    page = serializers.join_array(fragments)
+    return page._replace(cursor=rows[-1].id) if len(rows) == limit else page
 
-    users = User.query.all()
-    all_users_ll = linked_list.LinkedList()
 
-    for user in users:
-        all_users_ll.insert_at_end(
-            {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "address": user.address,
-                "phone": user.phone
-            }
-        )
+@api.route("/user/descending_id", methods=["GET"])
+def get_all_users_descending():
+    """Get users in descending id order. See `_list_users` for the
+    pagination and streaming options. Returning 200 if successful.
+    """
+    return _list_users(descending=True)
 
-    return jsonify(all_users_ll.to_list()), 200
 
+@api.route("/user/ascending_id", methods=["GET"])
+def get_all_users_ascending():
+    """Get users in ascending id order. See `_list_users` for the
+    pagination and streaming options. Returning 200 if successful.
+    """
+    return _list_users(descending=False)
 
-@app.route("/user/<user_id>", methods=["GET"])
+
+@api.route("/user/<int:user_id>", methods=["GET"])
 def get_one_user(user_id):
+    """Get a single user by primary key. SQLite looks the row up through
+    the primary key index, so the cost does not grow with the table size.
+    Returning 404 if there is no such user.
+    """
+
+    include = request.args.get("include")
+    if include == "posts":
+        return _get_user_with_posts(user_id)
+    if include is not None:
+        return jsonify({"message": "include must be posts"}), 400
+
+    user = _services().cache.get_or_set(f"user:{user_id}", lambda: _fetch_user(user_id))
+    if user is None:
+        return jsonify({"message": "user not found"}), 404
+
+    return serializers.json_response(user)
+
+
+def _get_user_with_posts(user_id):
+    """The user with all their posts, newest first, for `?include=posts`.
+    A user and their posts live on the same shard, so this is two queries
+    on one connection, the second walking the (user_id, date, id) index
+    backwards. Users with many posts are better paged through
+    `/user/<id>/blog_posts`.
+    """
+    connection = _read_connection(_shard_of(user_id))
+    user = connection.execute(
+        db.select(*USER_COLUMNS).where(User.id == user_id)
+    ).first()
+    if user is None:
+        return jsonify({"message": "user not found"}), 404
+
+    posts = connection.execute(
+        db.select(BlogPost.id, BlogPost.title, BlogPost.body, BlogPost.user_id, BlogPost.date)
+        .where(BlogPost.user_id == user_id, BlogPost.deleted_at.is_(None))
+        .order_by(BlogPost.date.desc(), BlogPost.id.desc())
+    )
+    return serializers.json_response(serializers.encode({
+        **user._asdict(),
+        "posts": [post._asdict() for post in posts],
+    }))
+
+
+def _fetch_user(user_id):
+    """The user's encoded JSON, or None if there is no such user."""
+    user = _read_connection(_shard_of(user_id)).execute(
+        db.select(*USER_COLUMNS).where(User.id == user_id)
+    ).first()
+    return serializers.encode(user._asdict()) if user is not None else None
+
 
-    users = User.query.all()
-    all_users_ll = linked_list.LinkedList()
+# Most ids accepted by one call to the multi-get endpoints
+MULTI_GET_MAX_IDS = 1000
 
-    for user in users:
-        all_users_ll.insert_at_end(
-            {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "address": user.address,
-                "phone": user.phone
-            }
+
+def _ids_arg():
+    """The `ids` query string argument: comma separated integers, or the
+    argument repeated. Raises ValueError, also for ids too large for SQLite.
+    """
+    ids = [
+        _sqlite_int(part)
+        for value in request.args.getlist("ids")
+        for part in value.split(",") if part.strip()
+    ]
+    if not ids or len(ids) > MULTI_GET_MAX_IDS:
+        raise ValueError
+    return ids
+
+
+def _multi_get(prefix, ids, fetch):
+    """Response of a multi-get endpoint: `results` holds the entity of each
+    id in request order (null where there is none) and `missing` the ids
+    not found. Entities are read through the cache under the keys of the
+    single entity endpoints, and all the misses are fetched with one
+    `fetch(ids)` call returning {id: encoded JSON}.
+    """
+    keys = {f"{prefix}:{id_}": id_ for id_ in ids}
+    values = _services().cache.get_or_set_many(
+        list(keys),
+        lambda missing: {
+            f"{prefix}:{id_}": value
+            for id_, value in fetch([keys[key] for key in missing]).items()
+        }
+    )
+    found = {keys[key]: value for key, value in values.items()}
+    return serializers.json_response(serializers.join_object({
+        "results": serializers.join_array([
+            found[id_].body if found[id_] is not None else b"null" for id_ in ids
+        ]).body,
+        "missing": serializers.dumps(
+            list(dict.fromkeys(id_ for id_ in ids if found[id_] is None))
+        ),
+    }))
+
+
+@api.route("/user", methods=["GET"])
+def get_many_users():
+    """Get up to 1000 users at once, e.g. `/user?ids=3,1,2`. Users already
+    cached are not read again and the others are read with a single
+    `WHERE id IN (...)` query per shard. See `_multi_get` for the response.
+    """
+    try:
+        ids = _ids_arg()
+    except ValueError:
+        return jsonify({
+            "message": f"ids must be 1 to {MULTI_GET_MAX_IDS} comma separated integers"
+        }), 400
+    return _multi_get("user", ids, _fetch_users)
+
+
+def _fetch_users(user_ids):
+    """{user_id: encoded JSON} of the existing users among `user_ids`."""
+    by_shard = defaultdict(list)
+    for user_id in user_ids:
+        by_shard[_shard_of(user_id)].append(user_id)
+    results = _scatter(
+        lambda shard: _read_connection(shard).execute(
+            db.select(*USER_COLUMNS).where(User.id.in_(by_shard[shard]))
+        ).all(),
+        list(by_shard)
+    )
+    return {
+        row.id: serializers.encode(row._asdict())
+        for rows in results for row in rows
+    }
+
+
+# Columns returned by the per-user post listing
+USER_POST_COLUMNS = (
+    BlogPost.id, BlogPost.title, BlogPost.body, BlogPost.date, BlogPost.user_id
+)
+
+
+@api.route("/user/<int:user_id>/blog_posts", methods=["GET"])
+def get_user_blog_posts(user_id):
+    """Get a user's posts by date, newest first (`order=asc` for oldest
+    first), `limit` at a time.
+
+    The query walks the (user_id, date, id) index, so it reads only the
+    rows of the page. The keyset cursor `after` is the date and id of the
+    last post seen (`2021-05-18:42`), and the `Link` header points at the
+    next page. Returning 404 if there is no such user.
+    """
+    descending = request.args.get("order", "desc") != "asc"
+    try:
+        limit = _int_arg("limit", default=20, minimum=1, maximum=1000)
+        after = request.args.get("after")
+        if after is not None:
+            after_date, _, after_id = after.partition(":")
+            after_date, after_id = date.fromisoformat(after_date), _sqlite_int(after_id)
+    except ValueError:
+        return jsonify({"message": "limit and after are invalid"}), 400
+
+    query = db.select(*USER_POST_COLUMNS).where(
+        BlogPost.user_id == user_id, BlogPost.deleted_at.is_(None)
+    )
+    if descending:
+        query = query.order_by(BlogPost.date.desc(), BlogPost.id.desc())
+    else:
+        query = query.order_by(BlogPost.date, BlogPost.id)
+    if after is not None:
+        key = tuple_(BlogPost.date, BlogPost.id)
+        query = query.where(
+            key < (after_date, after_id) if descending else key > (after_date, after_id)
         )
+    connection = _read_connection(_shard_of(user_id))
+    rows = connection.execute(query.limit(limit)).all()
+
+    if not rows and after is None and connection.execute(
+        db.select(User.id).where(User.id == user_id)
+    ).first() is None:
+        return jsonify({"message": "user not found"}), 404
 
-    user = all_users_ll.get_user_by_id(user_id)
-    return jsonify(user), 200
+    response = serializers.json_response(
+        serializers.encode([row._asdict() for row in rows])
+    )
+    if len(rows) == limit:
+        next_page = url_for(
+            request.endpoint, user_id=user_id, limit=limit,
+            order="desc" if descending else "asc",
+            after=f"{rows[-1].date.isoformat()}:{rows[-1].id}"
+        )
+        response.headers["Link"] = f'<{next_page}>; rel="next"'
+    return response
 
 
-@app.route("/user/<user_id>", methods=["DELETE"])
+@api.route("/user/<int:user_id>", methods=["DELETE"])
 def delete_user(user_id):
-    """Query user and delete them. But if user table references another
-    blog post table via foreign key, the blog posts also need to be deleted.
+    """Delete a user. The user table is referenced by the blog post table
+    via foreign key, so the user's blog posts are deleted first. Returning
+    404 if there is no such user.
     """
 
-    user = User.query.filter_by(id=user_id).first()
-    db.session.delete(user)
-    db.session.commit()
+    # One statement per table rather than loading every post to delete it
+    # through the ORM cascade; the user's posts are found through the
+    # (user_id, date, id) index, on the user's shard.
+    with _engine(_shard_of(user_id)).begin() as connection:
+        deleted_post_ids = connection.scalars(
+            db.delete(BlogPost).where(BlogPost.user_id == user_id).returning(BlogPost.id)
+        ).all()
+        deleted = connection.execute(db.delete(User).where(User.id == user_id)).rowcount
+    if not deleted:
+        return jsonify({"message": "user not found"}), 404
+
+    services = _services()
+    services.cache.invalidate(
+        f"user:{user_id}",
+        *(f"blog_post:{blog_post_id}" for blog_post_id in deleted_post_ids)
+    )
+    services.cache.invalidate_pages("users")
 
     return jsonify({}), 200
 
 
-@app.route("/blog_post/<user_id>", methods=["POST"])
+# Most posts accepted by one call to the bulk endpoint
+BULK_INSERT_MAX_POSTS = 10_000
+
+
+def _validation_error(error):
+    return jsonify({"message": "invalid request body", "errors": error.errors}), 400
+
+
+@api.route("/blog_post/<int:user_id>", methods=["POST"])
 def create_blog_post(user_id):
-    data = request.get_json()
-    user = User.query.filter_by(id=user_id).first()
-    if not user:
+    """Create a blog post for a user. The payload is validated before the
+    database is touched, and the user's existence is enforced by the
+    foreign key constraint on insert (on the user's shard) rather than by
+    a separate query.
+    """
+    try:
+        data = schemas.BLOG_POST_SCHEMA.validate(request.get_json(silent=True))
+    except schemas.ValidationError as error:
+        return _validation_error(error)
+
+    post = {
+        "title": data["title"],
+        "body": data["body"],
+        "user_id": user_id
+    }
+    services = _services()
+    if services.id_allocator is not None:
+        post["id"], = services.id_allocator.allocate("blog_post")
+    try:
+        with _engine(_shard_of(user_id)).begin() as connection:
+            post["id"], = connection.execute(
+                db.insert(BlogPost), {**post, "date": date.today()}
+            ).inserted_primary_key
+    except IntegrityError:
         return jsonify({"message": "user does not exist!"}), 400
+    services.cache.invalidate(f"blog_post:{post['id']}")
+    if services.derived_pipeline is not None:
+        services.derived_pipeline.submit([post["id"]])
 
-    ht = hash_table.HashTable(10)
-    ht.add_key_value("title", data["title"])
-    ht.add_key_value("body", data["body"])
-    ht.add_key_value("date", now)
-    ht.add_key_value("user_id", user_id)
+    return jsonify({"message": "new blog post created!"}), 200
+
+
+@api.route("/blog_post/<int:user_id>/bulk", methods=["POST"])
+def create_blog_posts_bulk(user_id):
+    """Create many blog posts for a user from a JSON array of posts. All
+    posts are validated first, then inserted with one executemany-style
+    statement in a single transaction: either every post is created or,
+    on any error, none are.
+    """
+    try:
+        posts = schemas.BLOG_POST_SCHEMA.validate_many(
+            request.get_json(silent=True), max_items=BULK_INSERT_MAX_POSTS
+        )
+    except schemas.ValidationError as error:
+        return _validation_error(error)
 
-    new_blog_post = BlogPost(
-        title=ht.get_value("title"),
-        body=ht.get_value("body"),
-        date=ht.get_value("date"),
-        user_id=ht.get_value("user_id")
+    today = date.today()
+    rows = [
+        {"title": post["title"], "body": post["body"], "date": today, "user_id": user_id}
+        for post in posts
+    ]
+    services = _services()
+    if services.id_allocator is not None:
+        for row, blog_post_id in zip(rows, services.id_allocator.allocate("blog_post", len(rows))):
+            row["id"] = blog_post_id
+    try:
+        with _engine(_shard_of(user_id)).begin() as connection:
+            ids = connection.scalars(
+                db.insert(BlogPost).returning(BlogPost.id, sort_by_parameter_order=True),
+                rows
+            ).all()
+    except IntegrityError:
+        return jsonify({"message": "user does not exist!"}), 400
+
+    services.cache.invalidate(*(f"blog_post:{blog_post_id}" for blog_post_id in ids))
+    if services.derived_pipeline is not None:
+        services.derived_pipeline.submit(ids)
+
+    return jsonify({"message": f"{len(ids)} blog posts created!", "ids": ids}), 200
+
+
+# Columns returned by the single post, range and multi-get endpoints
+BLOG_POST_COLUMNS = (BlogPost.id, BlogPost.title, BlogPost.body, BlogPost.user_id)
+
+
+@api.route("/blog_post/range", methods=["GET"])
+def get_blog_post_range():
+    """Get posts with ids in [start, end] in ascending order. Pass the last
+    id seen as `after_id` to get the next `limit` posts. The query walks
+    the primary key, so it reads only the rows of the page.
+    """
+    try:
+        start = _int_arg("start")
+        end = _int_arg("end")
+        after_id = _int_arg("after_id")
+        limit = _int_arg("limit", default=100, minimum=1, maximum=1000)
+    except ValueError:
+        return jsonify({
+            "message": "start, end, after_id and limit must be integers, limit at least 1"
+        }), 400
+
+    query = (
+        db.select(*BLOG_POST_COLUMNS)
+        .where(BlogPost.deleted_at.is_(None))
+        .order_by(BlogPost.id)
+        .limit(limit)
+    )
+    if start is not None:
+        query = query.where(BlogPost.id >= start)
+    if end is not None:
+        query = query.where(BlogPost.id <= end)
+    if after_id is not None:
+        query = query.where(BlogPost.id > after_id)
+    rows = itertools.islice(_read_sorted(query, operator.attrgetter("id")), limit)
+    return serializers.json_response(
+        serializers.encode([row._asdict() for row in rows])
     )
-    db.session.add(new_blog_post)
-    db.session.commit()
 
-    return jsonify({"message": "new blog post created!"}), 200
 
-@app.route("/blog_post/<blog_post_id>", methods=["GET"])
+# Relative weights of the title and body columns in the bm25 ranking
+SEARCH_WEIGHTS = (10.0, 1.0)
+
+# The matches are ranked first, and snippets (which need the body text)
+# are only made for the page of results that is returned.
+SEARCH_QUERY = f"""
+WITH page AS (
+    SELECT rowid AS id,
+           bm25(blog_post_fts, {SEARCH_WEIGHTS[0]}, {SEARCH_WEIGHTS[1]}) AS score
+    FROM blog_post_fts
+    WHERE blog_post_fts MATCH :match {{after}}
+    ORDER BY score, id
+    LIMIT :limit
+)
+SELECT blog_post.id, blog_post.title, blog_post.user_id,
+       snippet(blog_post_fts, 1, '<b>', '</b>', '...', 16) AS snippet,
+       page.score
+FROM page
+JOIN blog_post_fts ON blog_post_fts.rowid = page.id
+JOIN blog_post ON blog_post.id = page.id
+WHERE blog_post_fts MATCH :match
+ORDER BY page.score, page.id
+"""
+
+
+def _match_expression(q):
+    """Turn user input into an FTS5 query matching posts containing every
+    word. Each word is quoted, so characters that mean something to FTS5
+    cannot cause syntax errors; a trailing `*` is kept as a prefix search.
+    """
+    terms = []
+    for word in q.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+@api.route("/blog_post/search", methods=["GET"])
+def search_blog_posts():
+    """Full-text search over post titles and bodies, best matches first
+    by bm25 with title matches weighted higher. Each result has a snippet
+    of the body around the matched words.
+
+    Results are paged with a keyset cursor instead of an OFFSET, so later
+    pages cost no more than the first: `cursor` is the score and id of the
+    last result seen, and the `Link` header points at the next page.
+
+    Each shard ranks its own posts and the pages are merged by score. The
+    bm25 statistics are per shard, so with several shards the ranking is
+    close to, but not exactly, that of a single database.
+    """
+    if not _services().search_available:
+        return jsonify({"message": "full-text search is not available"}), 501
+    match = _match_expression(request.args.get("q", ""))
+    if not match:
+        return jsonify({"message": "q is required"}), 400
+    try:
+        limit = _int_arg("limit", default=20, minimum=1, maximum=100)
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            after_score, _, after_id = cursor.partition(":")
+            after_score, after_id = float(after_score), _sqlite_int(after_id)
+    except ValueError:
+        return jsonify({"message": "limit and cursor are invalid"}), 400
+
+    params = {"match": match, "limit": limit}
+    after = ""
+    if cursor is not None:
+        after = (
+            "AND (score > :after_score "
+            "OR (score = :after_score AND rowid > :after_id))"
+        )
+        params.update(after_score=after_score, after_id=after_id)
+    query = db.text(SEARCH_QUERY.format(after=after)).bindparams(**params)
+    rows = list(itertools.islice(
+        _read_sorted(query, operator.attrgetter("score", "id")), limit
+    ))
+
+    response = serializers.json_response(
+        serializers.encode([row._asdict() for row in rows])
+    )
+    if len(rows) == limit:
+        next_page = url_for(
+            request.endpoint, q=request.args["q"], limit=limit,
+            cursor=f"{rows[-1].score!r}:{rows[-1].id}"
+        )
+        response.headers["Link"] = f'<{next_page}>; rel="next"'
+    return response
+
+
+@api.route("/blog_post/<int:blog_post_id>", methods=["GET"])
 def get_one_blog_post(blog_post_id):
-    blog_posts = BlogPost.query.all()  # get all blogs in asc order
-    random.shuffle(blog_posts)
-    bst = binary_search_tree.BinarySearchTree()
-
-    for post in blog_posts:
-        bst.insert({
-            "id": post.id,
-            "title": post.title,
-            "body": post.body,
-            "user_id": post.user_id
-        })
-    post = bst.search(blog_post_id)
-    
+    """Get a single post through the cache, falling back to a primary key
+    lookup, so every worker process sees the posts written by the others.
+    """
+    post = _services().cache.get_or_set(
+        f"blog_post:{blog_post_id}",
+        lambda: _fetch_blog_posts([blog_post_id]).get(blog_post_id)
+    )
+
     if not post:
-        return jsonify({"message": "post not found"})
-    return jsonify(post), 200
+        return jsonify({"message": "post not found"}), 404
+    return serializers.json_response(post)
+
+
+@api.route("/blog_post", methods=["GET"])
+def get_many_blog_posts():
+    """Get up to 1000 posts at once, e.g. `/blog_post?ids=3,1,2`, through
+    the cache and then a single `WHERE id IN (...)` query per shard. See
+    `_multi_get` for the response.
+    """
+    try:
+        ids = _ids_arg()
+    except ValueError:
+        return jsonify({
+            "message": f"ids must be 1 to {MULTI_GET_MAX_IDS} comma separated integers"
+        }), 400
+    return _multi_get("blog_post", ids, _fetch_blog_posts)
+
+
+def _fetch_blog_posts(blog_post_ids):
+    """{blog_post_id: encoded JSON} of the live posts among `blog_post_ids`."""
+    query = (
+        db.select(*BLOG_POST_COLUMNS)
+        .where(BlogPost.id.in_(blog_post_ids), BlogPost.deleted_at.is_(None))
+    )
+    results = _scatter(lambda shard: _read_connection(shard).execute(query).all())
+    return {
+        row.id: serializers.encode(row._asdict())
+        for rows in results for row in rows
+    }
 
 
-@app.route("/blog_post/numeric_body", methods=["GET"])
+@api.route("/blog_post/numeric_body", methods=["GET"])
 def get_numeric_post_bodies():
-    """Convert all characters in a blog post into a number and sum them
-    up. For what?
+    """Get every post with its body replaced by the sum of its characters
+    as numbers. The sums are computed when a post is written, so this only
+    reads the precomputed column and streams the rows out as a JSON array
+    without loading the bodies or touching any ORM objects. Only a post
+    whose sum the background workers have not stored yet has its body
+    read, to compute the sum here.
     """
-    blog_posts = BlogPost.query.all()
+    rows = _read_sorted(
+        db.select(
+            BlogPost.id,
+            BlogPost.title,
+            BlogPost.numeric_body.label("body"),
+            # the misspelled key is part of the existing response format
+            BlogPost.user_id.label("user_ud"),
+            db.case(
+                (BlogPost.numeric_body.is_(None), BlogPost.body)
+            ).label("pending_body")
+        )
+        .where(BlogPost.deleted_at.is_(None))
+        .order_by(BlogPost.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE),
+        operator.attrgetter("id"),
+        stream=True
+    )
+    return Response(
+        stream_with_context(serializers.stream_array(_with_numeric_bodies(rows))),
+        mimetype="application/json"
+    ), 200
+
+
+def _with_numeric_bodies(rows):
+    for row in rows:
+        row = row._asdict()
+        pending_body = row.pop("pending_body")
+        if pending_body is not None:
+            row["body"] = checksum.numeric_body(pending_body)
+        yield row
+
+
+@api.route("/tasks/stats", methods=["GET"])
+def get_task_stats():
+    """Depth, lag and throughput of this process's derived field workers."""
+    pipeline = _services().derived_pipeline
+    if pipeline is None:
+        return jsonify({"workers": 0}), 200
+    return jsonify(pipeline.stats()), 200
+
+
+# Columns of each exportable table
+EXPORT_COLUMNS = {
+    "user": USER_COLUMNS,
+    "blog_post": (
+        BlogPost.id, BlogPost.title, BlogPost.body, BlogPost.date,
+        BlogPost.user_id, BlogPost.numeric_body
+    ),
+}
+
+# Rows read from SQLite and encoded at a time by an export
+EXPORT_CHUNK_ROWS = 5000
 
-    q = custom_queue.Queue()
-    for post in blog_posts:
-        q.enqueue(post)
 
-    return_list = []
-    for _ in range(len(blog_posts)):
-        post = q.dequeue()
-        numeric_body = 0
-        for char in post.data.body:
-            numeric_body += ord(char)
+def _prepare_export(table, format_, since_id=None, since_date=None):
+    """Everything needed to export `table`: its query, the watermarks
+    (largest id and date in the export, for the next incremental export)
+    and an entity tag that changes whenever the exported rows do.
 
-        post.data.body = numeric_body
+    The tag covers the database and its change log position (see
+    `TABLE_CHANGE_DDL`), as counts and largest values alone can repeat:
+    SQLite reuses the id of a deleted last row, so deleting a post and
+    creating another one leaves them unchanged.
 
-        return_list.append({
-            "id": post.data.id,
-            "title": post.data.title,
-            "body": post.data.body,
-            "user_ud": post.data.user_id
-        })
+    The query stops at the largest id seen while computing the tag, so
+    rows inserted while the export streams do not make it inconsistent.
+    """
+    columns = EXPORT_COLUMNS[table]
+    model = User if table == "user" else BlogPost
+    conditions = []
+    if model is BlogPost:
+        conditions.append(BlogPost.deleted_at.is_(None))
+        if since_date is not None:
+            conditions.append(BlogPost.date >= since_date)
+    if since_id is not None:
+        conditions.append(model.id > since_id)
+
+    summary = [db.func.count(), db.func.max(model.id)]
+    if model is BlogPost:
+        # the background workers fill in numeric_body after the insert
+        summary += [db.func.count(BlogPost.numeric_body), db.func.max(BlogPost.date)]
+    # the summaries of the shards: counts add up, the largest value wins
+    states = _scatter(
+        lambda shard: _read_connection(shard).execute(
+            db.select(*summary).where(*conditions)
+        ).one()
+    )
+    state = [
+        combine(value for value in values if value is not None)
+        for combine, values in zip(
+            (sum, functools.partial(max, default=None)) * 2, zip(*states)
+        )
+    ]
+    max_id = state[1] or 0
+    changes = _change_log_positions()
+    database = current_app.config["SQLALCHEMY_DATABASE_URI"]
+    etag = hashlib.blake2b(
+        repr((database, table, format_, since_id, since_date, changes, tuple(state))).encode(),
+        digest_size=12
+    ).hexdigest()
+
+    query = (
+        db.select(*columns)
+        .where(*conditions, model.id <= max_id)
+        .order_by(model.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    watermarks = {"id": max_id}
+    if model is BlogPost and state[3] is not None:
+        watermarks["date"] = state[3].isoformat()
+    return query, watermarks, etag
+
+
+def _export_chunks(table, format_, query):
+    rows = map(tuple, _read_sorted(query, operator.itemgetter(0), stream=True))
+    return export.encode(
+        format_,
+        [column.key for column in EXPORT_COLUMNS[table]],
+        iter(lambda: list(itertools.islice(rows, EXPORT_CHUNK_ROWS)), [])
+    )
 
-    return jsonify(return_list), 200
 
+@api.route("/export/<table>", methods=["GET"])
+def export_table(table):
+    """Download `user` or `blog_post` as a gzip compressed CSV (`format=csv`,
+    the default) or NDJSON file, or as Parquet or an Arrow stream when
+    pyarrow is installed (501 otherwise). Rows are read and compressed in
+    chunks, so the table never sits in memory.
 
-@app.route("/blog_post/<blog_post_id>", methods=["DELETE"])
+    `since_id` exports only rows with a larger id, and for posts
+    `since_date` only posts from that date on. The `X-Export-Watermark-Id`
+    (and `-Date`) headers give the values to pass next time to fetch just
+    the rows added since. The `ETag` changes with the exported rows, so
+    an `If-None-Match` request for unchanged data gets an empty 304.
+    Complete exports are also kept on disk and served from there until
+    the table changes.
+    """
+    if table not in EXPORT_COLUMNS:
+        return jsonify({"message": f"table must be one of {', '.join(EXPORT_COLUMNS)}"}), 404
+    format_ = request.args.get("format", "csv")
+    if format_ not in export.FORMATS:
+        return jsonify({"message": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    if format_ not in export.available_formats():
+        return jsonify({"message": f"{format_} export needs pyarrow, which is not installed"}), 501
+    try:
+        since_id = _int_arg("since_id")
+        since_date = request.args.get("since_date")
+        if since_date is not None:
+            if table != "blog_post":
+                raise ValueError
+            since_date = date.fromisoformat(since_date)
+    except ValueError:
+        return jsonify({"message": "since_id or since_date is invalid"}), 400
+
+    query, watermarks, etag = _prepare_export(table, format_, since_id, since_date)
+    extension, mimetype = export.FORMATS[format_]
+    headers = {f"X-Export-Watermark-{key.title()}": str(value) for key, value in watermarks.items()}
+
+    if etag in request.if_none_match:
+        response = Response(status=304, mimetype=mimetype, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    download_name = f"{table}{extension}"
+    snapshots = _services().export_snapshots
+    snapshot = None
+    if since_id is None and since_date is None:
+        snapshot = f"{table}-{format_}-{etag}{extension}"
+        path = snapshots.get(snapshot)
+        if path is not None:
+            response = send_file(
+                path, mimetype=mimetype, download_name=download_name,
+                as_attachment=True, etag=etag, conditional=True
+            )
+            response.headers.update(headers)
+            return response
+
+    chunks = _export_chunks(table, format_, query)
+    if snapshot is not None:
+        chunks = snapshots.tee(snapshot, chunks, replaces=f"{table}-{format_}-")
+    response = Response(
+        stream_with_context(chunks), mimetype=mimetype, headers=headers
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    response.set_etag(etag)
+    return response
+
+
+@api.cli.command("export")
+@click.argument("table", type=click.Choice(list(EXPORT_COLUMNS)))
+@click.option("--format", "format_", default="csv", type=click.Choice(list(export.FORMATS)))
+@click.option("--since-id", type=int, help="only rows with a larger id")
+@click.option("--since-date", type=click.DateTime(["%Y-%m-%d"]), help="only posts from this date on")
+@click.option("--output", "-o", help="file to write (default: <table> plus the format's extension)")
+def export_command(table, format_, since_id, since_date, output):
+    """Export a table to a compressed file, like GET /export/<table>."""
+    if since_date is not None:
+        since_date = since_date.date()
+    init_db()
+    query, watermarks, _ = _prepare_export(table, format_, since_id, since_date)
+    output = output or table + export.FORMATS[format_][0]
+    try:
+        chunks = _export_chunks(table, format_, query)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    with open(output, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+    print(f"exported {table} to {output}, watermarks {watermarks}")
+
+
+@api.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Hit, miss and eviction counters of this process's cache."""
+    return jsonify(_services().cache.stats()), 200
+
+
+@api.route("/blog_post/<int:blog_post_id>", methods=["DELETE"])
 def delete_blog_post(blog_post_id):
-    pass
+    """Delete a post with a single statement on its primary key, then drop
+    it from the cache, returning 404 if there is no such post. The post's
+    shard is not known from its id, so the shards are tried in turn.
+
+    With SOFT_DELETE on, the statement only sets `deleted_at`, a cheap
+    in-place update; the read endpoints skip such posts and the compactor
+    purges them later in batches.
+    """
+    if soft_delete_enabled():
+        statement = (
+            db.update(BlogPost)
+            .where(BlogPost.id == blog_post_id, BlogPost.deleted_at.is_(None))
+            .values(deleted_at=_utcnow())
+        )
+    else:
+        statement = db.delete(BlogPost).where(BlogPost.id == blog_post_id)
+    for shard in _shards():
+        with _engine(shard).begin() as connection:
+            deleted = connection.execute(statement).rowcount
+        if deleted:
+            break
+    if not deleted:
+        return jsonify({"message": "post not found"}), 404
+
+    _services().cache.invalidate(f"blog_post:{blog_post_id}")
+
+    return jsonify({"message": "blog post deleted"}), 200
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
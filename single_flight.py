@@ -0,0 +1,81 @@
+"""Coalescing of concurrent identical loads"""
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Makes concurrent loads of the same key share one call: the first
+    thread to ask for a key runs the load, and threads asking for it while
+    that load is in flight wait for its result (or its exception) instead
+    of running their own. Nothing is kept once the load finishes, so this
+    is not a cache, only protection against a thundering herd.
+
+    Calls are only shared between the threads of one process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call in flight
+        self.loads = 0
+        self.shared = 0
+
+    def do(self, key, load):
+        """`load()`, or the result of the call already loading `key`."""
+        return self.do_many([key], lambda keys: {key: load()})[key]
+
+    def do_many(self, keys, load):
+        """{key: value} for `keys`. The keys no other thread is loading are
+        loaded with a single `load(keys)` call, which returns {key: value}
+        (None for keys it leaves out); the others are waited for. A thread
+        only waits after finishing its own load, so two overlapping batches
+        cannot wait for each other.
+        """
+        own, others = {}, {}
+        with self._lock:
+            for key in keys:
+                if key in own:
+                    continue
+                call = self._calls.get(key)
+                if call is not None:
+                    others[key] = call
+                else:
+                    own[key] = self._calls[key] = _Call()
+            if own:
+                self.loads += 1
+            self.shared += len(others)
+
+        results = {}
+        if own:
+            try:
+                loaded = load(list(own))
+                for key, call in own.items():
+                    call.value = results[key] = loaded.get(key)
+            except BaseException as error:
+                for call in own.values():
+                    call.error = error
+                raise
+            finally:
+                with self._lock:
+                    for key in own:
+                        del self._calls[key]
+                for call in own.values():
+                    call.done.set()
+
+        for key, call in others.items():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            results[key] = call.value
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {"loads": self.loads, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,107 @@
+"""SQLite storage profiles: connection pragmas and pool sizes"""
+import sharding
+
+# `baseline` is how the app used to run: rollback journal, so one writer
+# blocks every reader, and SQLAlchemy's default pool.
+# `wal` lets readers and a writer work at the same time: WAL journal,
+# fsync only at checkpoints (still safe against corruption, a power cut
+# can lose the last transactions), a 64 MiB page cache, 256 MiB of the
+# file memory-mapped, temp tables in memory, and writers wait up to 5 s
+# for the lock instead of failing with "database is locked".
+PROFILES = {
+    "baseline": {
+        "pragmas": {},
+        "pool_size": 5,
+        "max_overflow": 10,
+        "read_pool_size": 5,
+    },
+    "wal": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -64_000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5_000,
+        },
+        "pool_size": 4,
+        "max_overflow": 4,
+        "read_pool_size": 16,
+    },
+}
+
+DEFAULT_PROFILE = "wal"
+
+# Range of SQLite's INTEGER, a signed 64-bit number. The driver raises
+# OverflowError for a Python int outside it.
+MIN_INTEGER = -(1 << 63)
+MAX_INTEGER = (1 << 63) - 1
+
+# Name of the Flask-SQLAlchemy bind used by the read-only GET endpoints
+READ_BIND = "read"
+
+
+def write_bind(shard):
+    """Bind key of a shard's engine for writes (None: the default engine)."""
+    return None if shard == 0 else f"shard{shard}"
+
+
+def read_bind(shard):
+    """Bind key of a shard's read-only engine."""
+    return READ_BIND if shard == 0 else f"shard{shard}-{READ_BIND}"
+
+
+def is_read_bind(bind):
+    return bind is not None and bind.split("-")[-1] == READ_BIND
+
+
+def configure(config, profile_name=None):
+    """Fill in the Flask-SQLAlchemy settings of an app config for a storage
+    profile. Must run before `SQLAlchemy(app)` creates the engines.
+
+    Writes go through the default engine, whose pool stays small since
+    SQLite only ever has one writer. The GET endpoints use a second,
+    larger pool (the `read` bind) on the same file whose connections are
+    put in `query_only` mode.
+
+    With SHARDS above 1, every further shard gets the same two engines
+    (`shard1` and `shard1-read`, ...) on its own file, see `sharding`.
+    """
+    profile_name = profile_name or config.get("SQLITE_PROFILE") or DEFAULT_PROFILE
+    try:
+        profile = PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(
+            f"unknown SQLITE_PROFILE {profile_name!r}, "
+            f"expected one of {', '.join(PROFILES)}"
+        ) from None
+
+    config["SQLITE_PROFILE"] = profile_name
+    config["SQLITE_PRAGMAS"] = dict(profile["pragmas"])
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": profile["pool_size"],
+        "max_overflow": profile["max_overflow"],
+    }
+    config["SHARDS"] = int(config.get("SHARDS") or 1)
+    urls = sharding.shard_urls(config["SQLALCHEMY_DATABASE_URI"], config["SHARDS"])
+    config["SQLALCHEMY_BINDS"] = {}
+    for shard, url in enumerate(urls):
+        if shard > 0:
+            config["SQLALCHEMY_BINDS"][write_bind(shard)] = {
+                "url": url,
+                "pool_size": profile["pool_size"],
+                "max_overflow": profile["max_overflow"],
+            }
+        config["SQLALCHEMY_BINDS"][read_bind(shard)] = {
+            "url": url,
+            "pool_size": profile["read_pool_size"],
+            "max_overflow": 0,
+        }
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run PRAGMA statements on a new DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value};")
+    cursor.close()
@@ -0,0 +1,214 @@
+"""Bounded background work queue, processed in batches by worker threads"""
+import threading
+import time
+import traceback
+
+from custom_queue import Queue
+
+
+class QueueFull(Exception):
+    """Raised by `BoundedQueue.put` when no room frees up in time."""
+
+
+class QueueClosed(Exception):
+    """Raised by `BoundedQueue.put` once the queue is closed."""
+
+
+class BoundedQueue:
+    """Thread-safe FIFO queue with room for at most `maxsize` items, on top
+    of `custom_queue.Queue`. Producers block while it is full, which is
+    the backpressure: work cannot pile up faster than it is done.
+
+    Every item is stored with the time it was enqueued, so consumers can
+    tell how far behind they are.
+    """
+
+    def __init__(self, maxsize=10_000):
+        self.maxsize = maxsize
+        self._items = Queue()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put_many(self, items, timeout=None):
+        """Enqueue `items` in order, waiting up to `timeout` seconds in all
+        for room. On QueueFull or QueueClosed, the items that did fit stay
+        queued and the rest are in the exception's `remaining` attribute.
+        """
+        items = list(items)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            for i, item in enumerate(items):
+                while len(self._items) >= self.maxsize and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        error = QueueFull(f"queue is full ({self.maxsize} items)")
+                        error.remaining = items[i:]
+                        raise error
+                    self._not_full.wait(remaining)
+                if self._closed:
+                    error = QueueClosed("queue is closed")
+                    error.remaining = items[i:]
+                    raise error
+                self._items.enqueue((item, time.monotonic()))
+                self._not_empty.notify()
+
+    def put(self, item, timeout=None):
+        self.put_many([item], timeout)
+
+    def get_batch(self, max_items, timeout=None):
+        """Dequeue up to `max_items` items as (item, enqueued_at) pairs,
+        waiting up to `timeout` seconds for the first one. Returns an empty
+        list on timeout, or once the queue is closed and empty.
+        """
+        with self._lock:
+            if not self._items and not self._closed:
+                self._not_empty.wait(timeout)
+            batch = []
+            while self._items and len(batch) < max_items:
+                batch.append(self._items.dequeue())
+            if batch:
+                self._not_full.notify(len(batch))
+            return batch
+
+    def oldest_age(self):
+        """Seconds the oldest queued item has been waiting, 0 if empty."""
+        with self._lock:
+            oldest = self._items.peek()
+        return time.monotonic() - oldest[1] if oldest is not None else 0.0
+
+    def close(self):
+        """Refuse new items and wake every waiting thread. Items already
+        queued can still be taken.
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class BatchWorkerPool:
+    """Threads that take items off a `BoundedQueue` in batches of up to
+    `batch_size` and hand each batch to `process_batch(items)`.
+
+    `submit` blocks for up to `put_timeout` seconds when the queue is
+    full. Past that the caller processes its own items (the work is never
+    dropped), which slows the producer down to the pace of the workers.
+
+    `shutdown` stops new submissions, lets the workers drain what is
+    queued, and waits for them.
+    """
+
+    def __init__(self, process_batch, workers=1, batch_size=500, maxsize=10_000,
+                 put_timeout=1.0, name="worker"):
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.queue = BoundedQueue(maxsize)
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.processed_inline = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, items):
+        items = list(items)
+        try:
+            self.queue.put_many(items, self.put_timeout)
+        except (QueueFull, QueueClosed) as error:
+            with self._lock:
+                self.enqueued += len(items) - len(error.remaining)
+            self._process(error.remaining, inline=True)
+        else:
+            with self._lock:
+                self.enqueued += len(items)
+
+    def _process(self, items, inline=False):
+        try:
+            self.process_batch(items)
+        except Exception:
+            traceback.print_exc()
+            with self._lock:
+                self.failed += len(items)
+            return
+        with self._lock:
+            if inline:
+                self.processed_inline += len(items)
+            else:
+                self.processed += len(items)
+                self.batches += 1
+
+    def _run(self):
+        while True:
+            batch = self.queue.get_batch(self.batch_size, timeout=1.0)
+            if not batch:
+                if self.queue.closed and not len(self.queue):
+                    return
+                continue
+            lag = time.monotonic() - batch[0][1]
+            with self._lock:
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+            self._process([item for item, _ in batch])
+
+    def shutdown(self, timeout=None):
+        """Stop accepting work and wait for the queued items to be done."""
+        self.queue.close()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "depth": len(self.queue),
+                "capacity": self.queue.maxsize,
+                "oldest_age_seconds": self.queue.oldest_age(),
+                "last_lag_seconds": self.last_lag,
+                "max_lag_seconds": self.max_lag,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "processed_inline": self.processed_inline,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
+
+
+def from_config(config, process_batch):
+    """Build the worker pool described by the app config, or None when
+    derived fields are computed in the request instead:
+
+    DERIVED_WORKERS      worker threads, 0 (default) to disable the pool
+    DERIVED_BATCH_SIZE   items per batch (500)
+    DERIVED_QUEUE_SIZE   queue bound (10000)
+    DERIVED_PUT_TIMEOUT  seconds a producer waits for room (1)
+    """
+    workers = int(config.get("DERIVED_WORKERS", 0))
+    if workers <= 0:
+        return None
+    return BatchWorkerPool(
+        process_batch,
+        workers=workers,
+        batch_size=int(config.get("DERIVED_BATCH_SIZE", 500)),
+        maxsize=int(config.get("DERIVED_QUEUE_SIZE", 10_000)),
+        put_timeout=float(config.get("DERIVED_PUT_TIMEOUT", 1)),
+        name="derived",
+    )
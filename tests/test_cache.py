@@ -0,0 +1,153 @@
+import os
+
+import pytest
+
+import cache
+from cache import MISSING, Cache, LocalCache, SQLiteCache, check_private_path
+from serializers import Encoded
+
+
+@pytest.fixture
+def private_dir(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o700)
+    return directory
+
+
+def test_local_cache_evicts_the_least_recently_used_entry():
+    backend = LocalCache(max_entries=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    # reading "a" makes "b" the least recently used
+    assert backend.get("a") == 1
+    backend.set("c", 3, ttl=60)
+    assert backend.get("b") is MISSING
+    assert backend.get("a") == 1
+    assert backend.get("c") == 3
+    assert len(backend) == 2
+    assert backend.stats.evictions == 1
+
+
+def test_local_cache_drops_expired_entries_when_read():
+    backend = LocalCache()
+    backend.set("gone", 1, ttl=0)
+    backend.set("kept", 2, ttl=60)
+    assert backend.get("gone") is MISSING
+    assert backend.get("kept") == 2
+    assert backend.stats.expirations == 1
+    assert backend.stats.misses == 1
+    assert len(backend) == 1
+
+
+def test_local_cache_stores_none():
+    backend = LocalCache()
+    backend.set("user:9", None, ttl=60)
+    assert backend.get("user:9") is None
+
+
+def test_delete_prefix():
+    backend = LocalCache()
+    for key in ("user:1", "user:2", "blog_post:1"):
+        backend.set(key, key, ttl=60)
+    backend.delete_prefix("user:")
+    assert backend.get("user:1") is MISSING
+    assert backend.get("blog_post:1") == "blog_post:1"
+
+
+def test_sqlite_cache_round_trips_encoded_documents_and_none(private_dir):
+    backend = SQLiteCache(str(private_dir / "cache.db"))
+    document = Encoded(b'{"id":1}', "etag", cursor=7)
+    backend.set("blog_post:1", document, ttl=60)
+    backend.set("blog_post:2", None, ttl=60)
+    assert backend.get("blog_post:1") == document
+    assert backend.get("blog_post:2") is None
+    assert backend.get("blog_post:3") is MISSING
+    with pytest.raises(TypeError):
+        backend.set("blog_post:4", {"id": 4}, ttl=60)
+
+
+def test_sqlite_cache_expires_and_evicts(private_dir):
+    backend = SQLiteCache(str(private_dir / "cache.db"), max_entries=2)
+    backend.EVICTION_CHECK_INTERVAL = 1
+    backend.set("gone", None, ttl=0)
+    assert backend.get("gone") is MISSING
+    assert backend.stats.expirations == 1
+    for key in ("a", "b", "c"):
+        backend.set(key, None, ttl=60)
+    assert len(backend) == 2
+    assert backend.stats.evictions == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(private_dir):
+    path = str(private_dir / "cache.db")
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    first.set("user:1", None, ttl=60)
+    assert second.get("user:1") is None
+    assert first.incr("generation:users") == 1
+    assert second.counter("generation:users") == 1
+    second.delete_prefix("user:")
+    assert first.get("user:1") is MISSING
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no Unix file owners")
+def test_check_private_path_rejects_a_directory_others_can_write(private_dir):
+    path = str(private_dir / "cache.db")
+    check_private_path(path)
+    os.chmod(private_dir, 0o777)
+    with pytest.raises(ValueError, match="not private"):
+        check_private_path(path)
+    with pytest.raises(ValueError, match="not private"):
+        SQLiteCache(path)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no Unix file owners")
+def test_check_private_path_rejects_a_file_others_can_write(private_dir):
+    path = private_dir / "cache.db"
+    path.touch(mode=0o600)
+    check_private_path(str(path))
+    os.chmod(path, 0o620)
+    with pytest.raises(ValueError, match="not private"):
+        check_private_path(str(path))
+
+
+def test_sqlite_cache_file_is_created_private(private_dir):
+    path = private_dir / "cache.db"
+    SQLiteCache(str(path))
+    assert path.stat().st_mode & 0o077 == 0
+
+
+def test_read_through_loads_misses_once():
+    calls = []
+    store = Cache(LocalCache(), ttl=60)
+
+    def loader():
+        calls.append(1)
+        return "value"
+
+    assert store.get_or_set("key", loader) == "value"
+    assert store.get_or_set("key", loader) == "value"
+    assert len(calls) == 1
+
+
+def test_get_or_set_many_caches_keys_the_loader_leaves_out_as_none():
+    store = Cache(LocalCache(), ttl=60)
+    assert store.get_or_set_many(["a", "b"], lambda keys: {"a": 1}) == {"a": 1, "b": None}
+    assert store.get_or_set_many(["a", "b"], lambda keys: pytest.fail("loaded again")) == {
+        "a": 1, "b": None
+    }
+
+
+def test_invalidate_pages_moves_to_a_new_generation():
+    store = Cache(LocalCache(), ttl=60)
+    key = store.page_key("users", 10, 0)
+    store.invalidate_pages("users")
+    assert store.page_key("users", 10, 0) != key
+
+
+def test_from_config():
+    assert isinstance(cache.from_config({}).backend, LocalCache)
+    assert cache.from_config({"CACHE_BACKEND": "none"}).backend.shared
+    with pytest.raises(ValueError, match="CACHE_PATH"):
+        cache.from_config({"CACHE_BACKEND": "sqlite"})
+    with pytest.raises(ValueError, match="unknown"):
+        cache.from_config({"CACHE_BACKEND": "redis"})
@@ -0,0 +1,130 @@
+import gzip
+import zlib
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+import compression
+from compression import Compression
+
+BODY = b'{"items":[' + b",".join(b'"item"' for _ in range(100)) + b"]}"
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    Compression(min_size=100, encodings=["gzip", "deflate"]).init_app(app)
+
+    @app.route("/large")
+    def large():
+        response = Response(BODY, mimetype="application/json")
+        response.set_etag("tag")
+        return response
+
+    @app.route("/small")
+    def small():
+        return Response(b"{}", mimetype="application/json")
+
+    @app.route("/binary")
+    def binary():
+        return Response(BODY, mimetype="application/gzip")
+
+    @app.route("/stream")
+    def stream():
+        return Response(
+            stream_with_context(b"line\n" for _ in range(1000)),
+            mimetype="application/x-ndjson",
+        )
+
+    @app.route("/not-modified")
+    def not_modified():
+        response = Response(status=304, mimetype="application/json")
+        response.set_etag("tag")
+        return response
+
+    return app.test_client()
+
+
+def test_best_accepted_encoding_is_used(client):
+    response = client.get("/large", headers={"Accept-Encoding": "deflate;q=0.5, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == BODY
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    response = client.get("/large", headers={"Accept-Encoding": "deflate"})
+    assert response.headers["Content-Encoding"] == "deflate"
+    assert zlib.decompress(response.data) == BODY
+
+
+def test_compressed_response_has_a_weak_etag(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["ETag"] == 'W/"tag"'
+
+
+def test_identity_when_no_encoding_is_accepted(client):
+    for accept in ("identity", "br", None):
+        headers = {"Accept-Encoding": accept} if accept else {}
+        response = client.get("/large", headers=headers)
+        assert "Content-Encoding" not in response.headers
+        assert response.data == BODY
+        assert response.headers["ETag"] == '"tag"'
+        assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_small_and_binary_bodies_are_sent_as_they_are(client):
+    for path in ("/small", "/binary"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert "Vary" not in response.headers
+
+
+def test_streamed_bodies_are_compressed_in_chunks(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data) == b"line\n" * 1000
+
+
+def test_not_modified_gets_the_headers_of_the_compressed_response(client):
+    response = client.get(
+        "/not-modified", headers={"Accept-Encoding": "gzip", "If-None-Match": 'W/"tag"'}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == 'W/"tag"'
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_not_modified_keeps_the_strong_tag_the_client_holds(client):
+    response = client.get(
+        "/not-modified", headers={"Accept-Encoding": "gzip", "If-None-Match": '"tag"'}
+    )
+    assert response.headers["ETag"] == '"tag"'
+    response = client.get("/not-modified", headers={"If-None-Match": 'W/"tag"'})
+    assert response.headers["ETag"] == '"tag"'
+
+
+def test_compress_chunks_closes_its_source():
+    closed = []
+
+    def chunks():
+        try:
+            yield b"a" * 10
+            yield b"b" * 10
+        finally:
+            closed.append(True)
+
+    stream = compression.compress_chunks("gzip", chunks(), buffer_size=5)
+    assert gzip.decompress(b"".join(stream)) == b"a" * 10 + b"b" * 10
+    assert closed == [True]
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        compression.compressor("lzma")
+
+
+def test_from_config():
+    assert compression.from_config({"COMPRESSION": "off"}) is None
+    configured = compression.from_config({"COMPRESSION_MIN_SIZE": "10", "COMPRESSION_LEVEL": "1"})
+    assert (configured.min_size, configured.level) == (10, 1)
+    assert configured.encodings == compression.available_encodings()
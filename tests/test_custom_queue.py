@@ -0,0 +1,66 @@
+import pytest
+
+from custom_queue import Queue
+
+
+def test_dequeue_returns_the_payload_in_fifo_order():
+    queue = Queue()
+    for item in ("a", "b", "c"):
+        queue.enqueue(item)
+    assert len(queue) == 3
+    assert queue.peek() == "a"
+    assert [queue.dequeue() for _ in range(3)] == ["a", "b", "c"]
+    assert queue.dequeue() is None
+    assert queue.peek() is None
+    assert len(queue) == 0
+
+
+def test_extend_and_iteration_keep_the_order():
+    queue = Queue.from_iterable([1, 2])
+    queue.extend([3, 4])
+    assert list(queue) == [1, 2, 3, 4]
+    # iterating does not consume
+    assert len(queue) == 4
+
+
+def test_linked_node_attributes_are_gone():
+    # the items are no longer linked nodes, so walking them must fail loudly
+    queue = Queue.from_iterable([1, 2])
+    with pytest.raises(AttributeError):
+        queue.head
+    with pytest.raises(AttributeError):
+        queue.tail
+
+
+def test_get_needs_index_key():
+    with pytest.raises(TypeError):
+        Queue().get(1)
+
+
+def test_get_finds_queued_items_by_key():
+    queue = Queue(index_key="id")
+    queue.extend([{"id": 1}, {"id": 2}])
+    assert queue.get(2) == {"id": 2}
+    assert queue.get(3) is None
+    queue.dequeue()
+    assert queue.get(1) is None
+    assert queue.get(2) == {"id": 2}
+
+
+def test_dequeue_with_duplicate_keys_moves_the_index_to_the_next_item():
+    first, second, third = {"id": 1, "n": 1}, {"id": 1, "n": 2}, {"id": 1, "n": 3}
+    queue = Queue(index_key="id")
+    queue.enqueue(first)
+    queue.enqueue({"id": 2})
+    queue.enqueue(second)
+    queue.enqueue(third)
+    # the oldest item wins
+    assert queue.get(1) is first
+    assert queue.dequeue() is first
+    assert queue.get(1) is second
+    queue.dequeue()
+    assert queue.dequeue() is second
+    assert queue.get(1) is third
+    assert queue.dequeue() is third
+    assert queue.get(1) is None
+    assert queue.dequeue() is None
@@ -0,0 +1,105 @@
+import pytest
+
+from hash_table import HashTable
+
+
+class CollidingKey:
+    """A key whose hash is fixed, to force every key onto one probe chain."""
+
+    def __init__(self, name, hash_=7):
+        self.name = name
+        self.hash_ = hash_
+
+    def __hash__(self):
+        return self.hash_
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+
+def test_insert_and_get():
+    table = HashTable()
+    table.add_key_value("a", 1)
+    table["b"] = 2
+    assert table.get_value("a") == 1
+    assert table["b"] == 2
+    assert table.get_value("missing") is None
+    with pytest.raises(KeyError):
+        table["missing"]
+    assert len(table) == 2
+
+
+def test_insert_replaces_existing_value():
+    table = HashTable()
+    table["a"] = 1
+    table["a"] = 2
+    assert table["a"] == 2
+    assert len(table) == 1
+
+
+def test_delete():
+    table = HashTable()
+    table["a"] = 1
+    table["b"] = 2
+    assert table.delete_key("a") == 1
+    assert table.delete_key("a") is None
+    assert "a" not in table
+    assert table["b"] == 2
+    del table["b"]
+    with pytest.raises(KeyError):
+        del table["b"]
+    assert len(table) == 0
+
+
+def test_lookup_probes_past_deleted_slots():
+    table = HashTable()
+    keys = [CollidingKey(name) for name in "abcd"]
+    for value, key in enumerate(keys):
+        table[key] = value
+    del table[keys[1]]
+    assert table[keys[3]] == 3
+    # the freed slot is reused rather than growing the chain
+    table[CollidingKey("e")] = 4
+    assert sorted(key.name for key in table) == ["a", "c", "d", "e"]
+
+
+def test_grows_and_shrinks_with_the_number_of_keys():
+    table = HashTable()
+    assert table.table_size == 8
+    for i in range(1000):
+        table[i] = str(i)
+    assert len(table) == 1000
+    assert table.table_size >= 1500
+    # the table stays under two thirds full
+    assert len(table) * 3 < table.table_size * 2
+    assert all(table[i] == str(i) for i in range(1000))
+
+    for i in range(990):
+        del table[i]
+    assert table.table_size < 1000
+    assert len(table) == 10
+    assert all(table[i] == str(i) for i in range(990, 1000))
+
+
+def test_initial_size_is_rounded_up_to_a_power_of_two():
+    assert HashTable(100).table_size == 128
+    assert HashTable(1).table_size == 8
+
+
+def test_mapping_protocol():
+    table = HashTable()
+    table.update({"a": 1, "b": 2, "c": 3})
+    assert dict(table.items()) == {"a": 1, "b": 2, "c": 3}
+    assert sorted(table) == ["a", "b", "c"]
+    assert table.pop("b") == 2
+    assert table.get("b", "default") == "default"
+    table.clear()
+    assert len(table) == 0 and list(table) == []
+
+
+def test_changing_size_during_iteration_raises():
+    table = HashTable()
+    table.update({"a": 1, "b": 2})
+    with pytest.raises(RuntimeError):
+        for key in table:
+            table[key + "!"] = 0
@@ -0,0 +1,67 @@
+import pytest
+
+from schemas import BLOG_POST_SCHEMA, Field, Schema, ValidationError
+
+
+def _errors(validate, *args, **kwargs):
+    with pytest.raises(ValidationError) as caught:
+        validate(*args, **kwargs)
+    return caught.value.errors
+
+
+def test_valid_payload_keeps_known_fields_only():
+    data = {"title": "t", "body": "b", "user_id": 3}
+    assert BLOG_POST_SCHEMA.validate(data) == {"title": "t", "body": "b"}
+    # a new dict, not the request's
+    assert "user_id" in data
+
+
+def test_every_problem_is_reported():
+    assert _errors(BLOG_POST_SCHEMA.validate, {"title": 5}) == {
+        "title": "expected string",
+        "body": "missing required field",
+    }
+
+
+@pytest.mark.parametrize("data", [None, [], "title", 3])
+def test_non_object_payload(data):
+    assert _errors(BLOG_POST_SCHEMA.validate, data) == {"_schema": "expected a JSON object"}
+
+
+def test_booleans_are_not_numbers():
+    schema = Schema(count=Field(int), flag=Field(bool))
+    assert _errors(schema.validate, {"count": True, "flag": True}) == {
+        "count": "expected integer"
+    }
+    assert schema.validate({"count": 1, "flag": False}) == {"count": 1, "flag": False}
+
+
+def test_optional_fields_and_several_types():
+    schema = Schema(score=Field((int, float)), note=Field(str, required=False))
+    assert schema.validate({"score": 1.5}) == {"score": 1.5}
+    assert _errors(schema.validate, {"score": "high", "note": 1}) == {
+        "score": "expected integer or number",
+        "note": "expected string",
+    }
+
+
+def test_validate_many_reports_errors_by_index():
+    items = [{"title": "a", "body": "b"}, {"title": "a"}, {"title": "c", "body": "d"}]
+    assert _errors(BLOG_POST_SCHEMA.validate_many, items) == {
+        1: {"body": "missing required field"}
+    }
+    assert BLOG_POST_SCHEMA.validate_many(items[:1]) == items[:1]
+
+
+@pytest.mark.parametrize("items", [None, [], {"title": "a", "body": "b"}])
+def test_validate_many_needs_a_non_empty_array(items):
+    assert _errors(BLOG_POST_SCHEMA.validate_many, items) == {
+        "_schema": "expected a non-empty JSON array"
+    }
+
+
+def test_validate_many_limits_the_batch_size():
+    items = [{"title": "a", "body": "b"}] * 3
+    assert _errors(BLOG_POST_SCHEMA.validate_many, items, max_items=2) == {
+        "_schema": "at most 2 items per request"
+    }
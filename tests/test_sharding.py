@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+
+from sharding import IdAllocator, shard_of, shard_urls
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sequences.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_ids_continue_after_the_largest_existing_id(engine):
+    allocator = IdAllocator(engine, block_size=10)
+    allocator.initialize("user", 41)
+    assert allocator.allocate("user") == [42]
+    assert allocator.allocate("user", 3) == [43, 44, 45]
+
+
+def test_initialize_never_moves_a_sequence_back(engine):
+    IdAllocator(engine).initialize("user", 100)
+    allocator = IdAllocator(engine)
+    allocator.initialize("user", 5)
+    allocator.initialize("blog_post", None)
+    assert allocator.allocate("user") == [101]
+    assert allocator.allocate("blog_post") == [1]
+
+
+def test_allocators_sharing_a_sequence_reserve_separate_blocks(engine):
+    first, second = IdAllocator(engine, block_size=5), IdAllocator(engine, block_size=5)
+    first.initialize("user", 0)
+    assert first.allocate("user", 2) == [1, 2]
+    # the second process skips the rest of the first one's block
+    assert second.allocate("user", 2) == [6, 7]
+    assert first.allocate("user", 4) == [3, 4, 5, 11]
+
+
+def test_a_request_larger_than_a_block_is_reserved_at_once(engine):
+    allocator = IdAllocator(engine, block_size=2)
+    allocator.initialize("user", 0)
+    assert allocator.allocate("user", 7) == list(range(1, 8))
+    assert allocator.allocate("user", 1) == [8]
+
+
+def test_concurrent_allocations_never_hand_out_an_id_twice(engine):
+    allocators = [IdAllocator(engine, block_size=3) for _ in range(2)]
+    allocators[0].initialize("blog_post", 0)
+    ids = []
+    lock = threading.Lock()
+
+    def allocate(allocator):
+        for _ in range(50):
+            allocated = allocator.allocate("blog_post", 2)
+            with lock:
+                ids.extend(allocated)
+
+    threads = [
+        threading.Thread(target=allocate, args=(allocator,))
+        for allocator in allocators for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert len(ids) == 400
+    assert len(set(ids)) == 400
+
+
+def test_shard_of_is_stable_and_spreads_ids():
+    assert shard_of(12345, 1) == 0
+    shards = [shard_of(user_id, 4) for user_id in range(1, 1001)]
+    assert shards == [shard_of(user_id, 4) for user_id in range(1, 1001)]
+    assert all(shards.count(shard) > 150 for shard in range(4))
+
+
+@pytest.mark.parametrize("user_id", [1 << 63, -(1 << 63) - 1])
+def test_shard_of_rejects_ids_beyond_64_bits(user_id):
+    with pytest.raises(ValueError):
+        shard_of(user_id, 1)
+
+
+def test_shard_urls():
+    assert shard_urls("sqlite:///sqlitedb.file", 3) == [
+        "sqlite:///sqlitedb.file",
+        "sqlite:///sqlitedb-shard1.file",
+        "sqlite:///sqlitedb-shard2.file",
+    ]
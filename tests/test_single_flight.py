@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _in_thread(func):
+    """Start `func` in a thread, returning the thread and a dict that gets
+    its "result" or "error".
+    """
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func()
+        except Exception as error:
+            outcome["error"] = error
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def test_do_many_loads_own_keys_and_leaves_out_missing_ones():
+    flight = SingleFlight()
+    calls = []
+
+    def load(keys):
+        calls.append(keys)
+        return {key: key * 10 for key in keys if key != 3}
+
+    assert flight.do_many([1, 2, 3, 1], load) == {1: 10, 2: 20, 3: None}
+    assert calls == [[1, 2, 3]]
+    assert flight.stats() == {"loads": 1, "shared": 0, "in_flight": 0}
+
+
+def test_concurrent_callers_share_one_load():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    first, first_outcome = _in_thread(lambda: flight.do("key", load))
+    assert started.wait(5)
+    second, second_outcome = _in_thread(lambda: flight.do("key", load))
+    while flight.stats()["shared"] == 0:
+        threading.Event().wait(0.001)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert first_outcome == second_outcome == {"result": "value"}
+    assert len(calls) == 1
+    assert flight.stats() == {"loads": 1, "shared": 1, "in_flight": 0}
+
+
+def test_error_reaches_the_loader_and_every_waiter_and_is_not_kept():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing_load():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("database is locked")
+
+    first, first_outcome = _in_thread(lambda: flight.do("key", failing_load))
+    assert started.wait(5)
+    second, second_outcome = _in_thread(lambda: flight.do("key", lambda: "unused"))
+    while flight.stats()["shared"] == 0:
+        threading.Event().wait(0.001)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert isinstance(first_outcome["error"], RuntimeError)
+    assert second_outcome["error"] is first_outcome["error"]
+    # the failure is not cached: the next call loads again
+    assert flight.do("key", lambda: "fresh") == "fresh"
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_error_in_the_calling_thread_propagates():
+    flight = SingleFlight()
+
+    def load(keys):
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        flight.do_many([1, 2], load)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_overlapping_batches_each_load_their_own_keys_and_share_the_rest():
+    flight = SingleFlight()
+    first_started, release_first = threading.Event(), threading.Event()
+    loaded = []
+
+    def first_load(keys):
+        loaded.append(("first", keys))
+        first_started.set()
+        release_first.wait(5)
+        return {key: f"first:{key}" for key in keys}
+
+    def second_load(keys):
+        loaded.append(("second", keys))
+        return {key: f"second:{key}" for key in keys}
+
+    first, first_outcome = _in_thread(lambda: flight.do_many([1, 2], first_load))
+    assert first_started.wait(5)
+    # 2 is in flight in the first batch, 3 is not
+    second, second_outcome = _in_thread(lambda: flight.do_many([2, 3], second_load))
+    while flight.stats()["shared"] == 0:
+        threading.Event().wait(0.001)
+    # the second batch loads its own key without waiting for the first
+    while ("second", [3]) not in loaded:
+        threading.Event().wait(0.001)
+    release_first.set()
+    first.join(5)
+    second.join(5)
+
+    assert first_outcome == {"result": {1: "first:1", 2: "first:2"}}
+    assert second_outcome == {"result": {2: "first:2", 3: "second:3"}}
+    assert loaded == [("first", [1, 2]), ("second", [3])]
+    assert flight.stats() == {"loads": 2, "shared": 1, "in_flight": 0}
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from task_queue import BatchWorkerPool, BoundedQueue, QueueClosed, QueueFull
+
+
+def _items(batch):
+    return [item for item, _ in batch]
+
+
+def test_get_batch_is_fifo_and_bounded_by_max_items():
+    queue = BoundedQueue(maxsize=10)
+    queue.put_many(range(5))
+    assert _items(queue.get_batch(3)) == [0, 1, 2]
+    assert _items(queue.get_batch(3)) == [3, 4]
+    assert queue.get_batch(3, timeout=0.01) == []
+
+
+def test_put_times_out_when_full_and_keeps_what_fit():
+    queue = BoundedQueue(maxsize=2)
+    with pytest.raises(QueueFull) as caught:
+        queue.put_many(["a", "b", "c", "d"], timeout=0.01)
+    assert caught.value.remaining == ["c", "d"]
+    assert len(queue) == 2
+
+
+def test_full_queue_blocks_the_producer_until_a_batch_is_taken():
+    queue = BoundedQueue(maxsize=1)
+    queue.put("a")
+    done = threading.Event()
+
+    def produce():
+        queue.put("b", timeout=5)
+        done.set()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    # backpressure: no room, so the producer waits
+    assert not done.wait(0.05)
+    assert _items(queue.get_batch(1)) == ["a"]
+    assert done.wait(5)
+    producer.join(5)
+    assert _items(queue.get_batch(1)) == ["b"]
+
+
+def test_close_refuses_new_items_but_queued_ones_can_be_drained():
+    queue = BoundedQueue(maxsize=10)
+    queue.put_many([1, 2])
+    queue.close()
+    assert queue.closed
+    with pytest.raises(QueueClosed) as caught:
+        queue.put_many([3, 4])
+    assert caught.value.remaining == [3, 4]
+    assert _items(queue.get_batch(10)) == [1, 2]
+    # closed and empty: returns at once instead of waiting
+    assert queue.get_batch(10, timeout=5) == []
+
+
+def test_close_wakes_a_blocked_producer():
+    queue = BoundedQueue(maxsize=1)
+    queue.put("a")
+    outcome = {}
+
+    def produce():
+        try:
+            queue.put("b")
+        except QueueClosed as error:
+            outcome["remaining"] = error.remaining
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    queue.close()
+    producer.join(5)
+    assert outcome == {"remaining": ["b"]}
+
+
+def test_oldest_age():
+    queue = BoundedQueue()
+    assert queue.oldest_age() == 0.0
+    queue.put("a")
+    assert queue.oldest_age() >= 0.0
+
+
+def test_shutdown_drains_the_queued_items():
+    processed = []
+    pool = BatchWorkerPool(processed.extend, workers=2, batch_size=3)
+    pool.submit(range(10))
+    pool.shutdown(timeout=5)
+    assert sorted(processed) == list(range(10))
+    stats = pool.stats()
+    assert stats["depth"] == 0
+    assert stats["enqueued"] == stats["processed"] == 10
+    # after shutdown the caller processes its own items
+    pool.submit([10])
+    assert processed[-1] == 10
+    assert pool.stats()["processed_inline"] == 1
+
+
+def test_submit_processes_inline_when_the_queue_stays_full():
+    release = threading.Event()
+    started = threading.Event()
+    processed = []
+
+    def process(items):
+        if items == ["busy"]:
+            started.set()
+            release.wait(5)
+        processed.extend(items)
+
+    pool = BatchWorkerPool(process, workers=1, batch_size=1, maxsize=1, put_timeout=0.01)
+    pool.submit(["busy"])
+    assert started.wait(5)
+    pool.submit(["queued", "overflow"])
+    # "overflow" found no room, so the caller processed it itself
+    assert processed == ["overflow"]
+    release.set()
+    pool.shutdown(timeout=5)
+    assert sorted(processed) == ["busy", "overflow", "queued"]
+    stats = pool.stats()
+    assert stats["processed_inline"] == 1
+    assert stats["enqueued"] == 2
+
+
+def test_failed_batches_are_counted_and_do_not_stop_the_workers(capsys):
+    processed = []
+
+    def process(items):
+        if "bad" in items:
+            raise RuntimeError("boom")
+        processed.extend(items)
+
+    pool = BatchWorkerPool(process, workers=1, batch_size=1)
+    pool.submit(["bad", "good"])
+    pool.shutdown(timeout=5)
+    assert processed == ["good"]
+    assert pool.stats()["failed"] == 1
+    assert "RuntimeError: boom" in capsys.readouterr().err